@@ -0,0 +1,24 @@
+# app/api/health.py
+from __future__ import annotations
+from fastapi import APIRouter, Response, status
+from app.container import container, is_ready
+
+router = APIRouter()
+
+@router.get("/healthz")
+def healthz() -> dict:
+    """
+    Liveness probe: the process is up and serving requests
+    """
+    return {"status": "ok"}
+
+@router.get("/readyz")
+def readyz(response: Response) -> dict:
+    """
+    Readiness probe: the database pool, the PSP session and the OAuth token are warm
+    (also reports the user cache hit/miss counters)
+    """
+    if not is_ready():
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {"status": "starting"}
+    return {"status": "ready", "user_cache": container["repo"].users.stats()}
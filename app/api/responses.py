@@ -0,0 +1,34 @@
+# app/api/responses.py
+from __future__ import annotations
+from typing import Any, Dict
+import orjson
+from fastapi import Response
+
+
+class FastJSONResponse(Response):
+    """
+    JSON response serialized with orjson, for routes that already build plain dicts
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)
+
+
+def raw_json_response(fields: Dict[str, Any], status_code: int = 200, **raw: bytes) -> Response:
+    """
+    Build a JSON object from 'fields' and splice each already-encoded JSON body
+    in 'raw' as the value of its key, without decoding it again.
+
+    Parameters:
+        fields (dict): values to serialize
+        raw (bytes): JSON documents to embed unchanged (e.g. PSP payloads)
+    Returns:
+        (Response): application/json response
+    """
+    body = orjson.dumps(fields)
+    if raw:
+        parts = [orjson.dumps(key) + b":" + (value.strip() or b"null") for key, value in raw.items()]
+        separator = b"," if fields else b""
+        body = body[:-1] + separator + b",".join(parts) + b"}"
+    return Response(content=body, status_code=status_code, media_type="application/json")
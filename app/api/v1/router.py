@@ -1,28 +1,65 @@
 # app/api/v1/router.py
 from __future__ import annotations
-from fastapi import APIRouter, Depends, HTTPException, Request
-from typing import Optional
-from app.store.repository import Repository
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from typing import Optional, List
+from app.store.repository import Repository, Payment
 from app.models.schemas import (
     CreateUserRequest, UserResponse, CreatePaymentRequest, PaymentResponse, 
-    PaymentStatus, WebhookPix, WebhookRequest, WebhookResponse, PaymentStatusUpdate
+    PaymentStatus, WebhookPix, WebhookRequest, WebhookResponse, PaymentStatusUpdate,
+    PaymentEventResponse, RollupBucketResponse, FINAL_STATUSES
 )
-from app.services.pix import Pix, PixError, WebhookError
+from app.services.pix import PixError, WebhookError
+from app.services.receivers import ReceiverPool, ReceiverError
+from app.services.expiry import ExpirationSweeper
+from app.services.dedup import RecentEvents
+from app.services.notifier import StatusNotifier
+from app.api.responses import FastJSONResponse, raw_json_response
 from app.container import container
 from app.auth import get_api_key
 
-import os, time, hmac, hashlib, json, httpx
+import os, time, hmac, hashlib, json, orjson, asyncio
+from datetime import datetime
 
 BACKEND_WEBHOOK_URL = os.getenv("BACKEND_WEBHOOK_URL")
 BACKEND_WEBHOOK_SECRET = os.getenv("BACKEND_WEBHOOK_SECRET", "")
 
+# (txid, status) of the last processed PSP webhooks, to drop redeliveries
+recent_webhooks = RecentEvents(maxsize=int(os.getenv("WEBHOOK_DEDUP_SIZE", "10000")))
+
 router = APIRouter(prefix="/api/v1")
 
 def get_repo() -> Repository:
     return container["repo"]
 
-def get_psp() -> Pix:
-    return container["psp"]
+def get_receivers() -> ReceiverPool:
+    return container["receivers"]
+
+def get_sweeper() -> ExpirationSweeper:
+    return container["sweeper"]
+
+def get_notifier() -> StatusNotifier:
+    return container["notifier"]
+
+def _payment_response(payment: Payment) -> FastJSONResponse:
+    """
+    Serialize a stored payment straight to JSON (same shape as PaymentResponse)
+    """
+    return FastJSONResponse({
+        "txid": payment.txid,
+        "status": payment.status.value,
+        "user_cpf": payment.user_cpf,
+        "amount": payment.amount,
+        "pixCopiaECola": payment.pixCopiaECola,
+        "receiver": payment.receiver,
+    })
+
+def _sign_payload(secret: str, timestamp: str, body: bytes) -> str:
+    """
+    HMAC-SHA256 (hex) of '<timestamp>.<body>', sent to the backend as X-Signature
+    """
+    return hmac.new(secret.encode(), f"{timestamp}.".encode() + body, hashlib.sha256).hexdigest()
 
 @router.post("/users", response_model=UserResponse)
 def create_user(
@@ -40,9 +77,10 @@ def create_user(
 def create_immediate_charge(
     req: CreatePaymentRequest, 
     repo: Repository = Depends(get_repo), 
-    psp: Pix = Depends(get_psp),
+    receivers: ReceiverPool = Depends(get_receivers),
+    sweeper: ExpirationSweeper = Depends(get_sweeper),
     api_key: str = Depends(get_api_key)
-) -> PaymentResponse:
+) -> Response:
     """
     Create an immediate PIX charge. # TODO: documentation
     """
@@ -52,9 +90,11 @@ def create_immediate_charge(
     try:
         amount_str = f"{req.amount:.2f}"
 
-        response = psp.create_immediate_charge(amount=amount_str, cpf=req.cpf, name=req.name)
+        with receivers.acquire(req.receiver) as receiver:
+            response = receiver.psp.create_immediate_charge(amount=amount_str, cpf=req.cpf, name=req.name)
         txid = response.get("txid")
         pixCopiaECola = response.get("pixCopiaECola")
+        expires_in = int(response.get("calendario", {}).get("expiracao") or receiver.psp.expiration)
         
         if not txid or not pixCopiaECola:
             raise HTTPException(status_code=500, detail="Invalid response from payment provider")
@@ -69,15 +109,12 @@ def create_immediate_charge(
             user_cpf=user_cpf, 
             amount=int(round(req.amount * 100)),
             pixCopiaECola=pixCopiaECola,
+            receiver=receiver.name,
+            expires_in=expires_in,
         )
+        sweeper.schedule(txid, expires_in)
 
-        return PaymentResponse(
-            status=payment.status,
-            user_cpf=payment.user_cpf,
-            txid=payment.txid,
-            amount=payment.amount,
-            pixCopiaECola=payment.pixCopiaECola,
-        )
+        return _payment_response(payment)
         
     except PixError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -87,41 +124,140 @@ def create_immediate_charge(
 @router.get("/pix/{txid}", response_model=PaymentResponse)
 def detail_payment(
     txid: str, 
+    consistent: bool = False,
     repo: Repository = Depends(get_repo), 
-    psp: Pix = Depends(get_psp),
+    receivers: ReceiverPool = Depends(get_receivers),
     api_key: str = Depends(get_api_key)
-) -> PaymentResponse:
+) -> Response:
     """
     Get detailed information about a specific payment. #TODO: documentation
+    Pass 'consistent=true' to read from the primary database (read-your-writes).
     """
     try:
-        payment = repo.get_payment(txid)
+        if consistent:
+            with repo.db.read_your_writes():
+                payment = repo.get_payment(txid)
+        else:
+            payment = repo.get_payment(txid)
         if not payment:
             raise HTTPException(status_code=404, detail="Payment not found")
         
-        psp_response = psp.detail_immediate_charge(txid)
+        psp_response = receivers.get(payment.receiver).detail_immediate_charge(txid)
         psp_status = psp_response.get("status", "").upper()
         
-        return PaymentResponse(
-            txid=payment.txid,
-            status=payment.status,
-            user_cpf=payment.user_cpf,
-            amount=payment.amount,
-            pixCopiaECola=payment.pixCopiaECola,
-        )
+        return _payment_response(payment)
         
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail="Failed to get payment details")
 
+@router.get("/pix/{txid}/events")
+async def payment_status_events(
+    txid: str,
+    request: Request,
+    mode: str = "sse",
+    since: Optional[PaymentStatus] = None,
+    timeout: float = 25.0,
+    repo: Repository = Depends(get_repo),
+    notifier: StatusNotifier = Depends(get_notifier),
+    api_key: str = Depends(get_api_key)
+) -> Response:
+    """
+    Push the status of a payment as soon as it changes, instead of polling GET /pix/{txid}.
+
+    mode=sse (default): Server-Sent Events stream, one 'status' event with the current
+    status and one per change, closed once the payment reaches a final status.
+    mode=poll: long-poll, answers as soon as the status differs from 'since' (or after
+    'timeout' seconds) with the current status.
+    """
+    async def current_payment() -> Payment:
+        try:
+            payment = await run_in_threadpool(repo.get_payment, txid)
+        except Exception:
+            raise HTTPException(status_code=500, detail="Failed to get payment status")
+        if not payment:
+            raise HTTPException(status_code=404, detail="Payment not found")
+        return payment
+
+    if mode == "poll":
+        # subscribed before reading, so a change in between is not missed
+        with notifier.subscription(txid) as queue:
+            status = (await current_payment()).status
+            deadline = time.monotonic() + min(timeout, 60.0)
+            while status == since and status not in FINAL_STATUSES:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    changed = await asyncio.wait_for(queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                status = changed or (await run_in_threadpool(repo.get_payment, txid)).status
+            return FastJSONResponse({"txid": txid, "status": status.value, "changed": status != since})
+
+    # answer 404/500 before the stream starts
+    await current_payment()
+
+    async def stream():
+        with notifier.subscription(txid) as queue:
+            status = (await run_in_threadpool(repo.get_payment, txid)).status
+            yield f"event: status\ndata: {orjson.dumps({'txid': txid, 'status': status.value}).decode()}\n\n"
+            while status not in FINAL_STATUSES:
+                try:
+                    changed = await asyncio.wait_for(queue.get(), 15.0)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield ": keepalive\n\n"
+                    continue
+                new_status = changed or (await run_in_threadpool(repo.get_payment, txid)).status
+                if new_status != status:
+                    status = new_status
+                    yield f"event: status\ndata: {orjson.dumps({'txid': txid, 'status': status.value}).decode()}\n\n"
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/pix/{txid}/history", response_model=List[PaymentEventResponse])
+def payment_history(
+    txid: str, 
+    repo: Repository = Depends(get_repo), 
+    api_key: str = Depends(get_api_key)
+) -> Response:
+    """
+    Status transitions of a payment, oldest first
+    """
+    try:
+        events = repo.get_history(txid)
+        if not events:
+            raise HTTPException(status_code=404, detail="Payment not found")
+        
+        return FastJSONResponse([
+            {
+                "txid": event.txid,
+                "old_status": event.old_status.value if event.old_status else None,
+                "new_status": event.new_status.value,
+                "created_at": event.created_at,
+            }
+            for event in events
+        ])
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="Failed to get payment history")
+
 @router.put("/pix/{txid}/status", response_model=PaymentResponse)
 def update_payment_status(
     txid: str, 
     repo: Repository = Depends(get_repo), 
-    psp: Pix = Depends(get_psp),
+    receivers: ReceiverPool = Depends(get_receivers),
     api_key: str = Depends(get_api_key)  # Require API key
-) -> PaymentResponse:
+) -> Response:
     """
     Update payment status by fetching latest status from PSP. # TODO: documentation
     """
@@ -130,30 +266,13 @@ def update_payment_status(
         if not payment:
             raise HTTPException(status_code=404, detail="Payment not found")
         
-        response = psp.detail_immediate_charge(txid)
-        psp_status = response.get("status", "").upper()
-        
-        if psp_status in ["CONCLUIDA"]:
-            new_status = PaymentStatus.CONCLUDED
-        elif psp_status in ["ATIVA"]:
-            new_status = PaymentStatus.ACTIVE
-        elif psp_status in ["REMOVIDA_PELO_USUARIO_RECEBEDOR"]:
-            new_status = PaymentStatus.REMOVED_BY_USER
-        elif psp_status in ["REMOVIDA_PELO_PSP"]:
-            new_status = PaymentStatus.REMOVED_BY_PSP
-        else:
-            new_status = PaymentStatus.ACTIVE
+        response = receivers.get(payment.receiver).detail_immediate_charge(txid)
+        new_status = PaymentStatus.from_psp(response.get("status", ""))
         
         if payment.status != new_status:
             payment = repo.set_status(txid, new_status)
         
-        return PaymentResponse(
-            txid=payment.txid,
-            status=payment.status,
-            user_cpf=payment.user_cpf,
-            amount=payment.amount,
-            pixCopiaECola=payment.pixCopiaECola,
-        )
+        return _payment_response(payment)
         
     except PixError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -166,92 +285,147 @@ def update_payment_status(
 def list_immediate_charges(
     inicio: str, 
     fim: str, 
-    psp: Pix = Depends(get_psp),
+    receiver: Optional[str] = None,
+    receivers: ReceiverPool = Depends(get_receivers),
     api_key: str = Depends(get_api_key)
-) -> dict:
+) -> Response:
     """
     List immediate charges between dates. # TODO: documentation
     """
     try:
-        result = psp.list_immediate_charges(inicio, fim)
-        return result
+        result = receivers.get(receiver).list_immediate_charges(inicio, fim, raw=True)
+        return Response(content=result, media_type="application/json")
     except PixError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail="Failed to list payments")
 
+@router.get("/reports/summary", response_model=List[RollupBucketResponse])
+def reports_summary(
+    inicio: str, 
+    fim: str, 
+    granularity: str = "day",
+    user_cpf: Optional[str] = None,
+    group_by: str = "status",
+    repo: Repository = Depends(get_repo),
+    api_key: str = Depends(get_api_key)
+) -> Response:
+    """
+    Count and amount (in cents) of the payments created between 'inicio' and 'fim'
+    ('yyyy-mm-dd-hh-mm-ss'), per 'hour' or 'day' and current status. Use 'group_by=user'
+    for one row per user or 'user_cpf' to filter a single user.
+    """
+    try:
+        start = datetime.strptime(inicio, '%Y-%m-%d-%H-%M-%S')
+        end = datetime.strptime(fim, '%Y-%m-%d-%H-%M-%S')
+    except ValueError:
+        raise HTTPException(status_code=422, detail="inicio and fim must be in 'yyyy-mm-dd-hh-mm-ss' format")
+    if granularity not in ("hour", "day") or group_by not in ("status", "user"):
+        raise HTTPException(status_code=422, detail="granularity must be 'hour' or 'day' and group_by 'status' or 'user'")
+
+    try:
+        buckets = repo.rollup_summary(start, end, granularity, user_cpf=user_cpf, by_user=group_by == "user")
+        
+        return FastJSONResponse([
+            {
+                "bucket": bucket.bucket,
+                "status": bucket.status.value,
+                "user_cpf": bucket.user_cpf,
+                "count": bucket.count,
+                "amount": bucket.amount,
+            }
+            for bucket in buckets
+        ])
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="Failed to build report")
+
 @router.post("/webhooks/config", response_model=WebhookResponse)
 def create_webhook(
     req: WebhookRequest, 
-    psp: Pix = Depends(get_psp),
+    receiver: Optional[str] = None,
+    receivers: ReceiverPool = Depends(get_receivers),
     api_key: str = Depends(get_api_key)
-) -> WebhookResponse:
+) -> Response:
     """
     Register a webhook URL with the PSP. Requires API key authentication. # TODO: documentation
     """
     try:
         webhook_url_str = str(req.webhook_url)
-        response = psp.create_webhook(webhook_url_str)
+        response = receivers.get(receiver).create_webhook(webhook_url_str, raw=True)
         
-        return WebhookResponse(
-            webhook_url=webhook_url_str,
-            status="registered",
-            message="Webhook registered successfully",
+        return raw_json_response(
+            {
+                "webhook_url": webhook_url_str,
+                "status": "registered",
+                "message": "Webhook registered successfully",
+            },
             psp_response=response
         )
         
-    except WebhookError as e:
+    except (WebhookError, ReceiverError) as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to register webhook: {str(e)}")
 
 @router.get("/webhooks/config", response_model=WebhookResponse)
 def get_webhook_config(
-    psp: Pix = Depends(get_psp),
+    receiver: Optional[str] = None,
+    receivers: ReceiverPool = Depends(get_receivers),
     api_key: str = Depends(get_api_key)
-) -> WebhookResponse:
+) -> Response:
     """
     Get current webhook configuration. Requires API key authentication. # TODO: documentation
     """
     try:
-        response = psp.get_webhook()
-        webhook_url = response.get("webhookUrl", "")
+        psp = receivers.get(receiver)
+    except ReceiverError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        response = psp.get_webhook(raw=True)
+        webhook_url = orjson.loads(response).get("webhookUrl", "") if response.strip() else ""
         
-        return WebhookResponse(
-            webhook_url=webhook_url,
-            status="active" if webhook_url else "not_configured",
-            message="Current webhook configuration",
+        return raw_json_response(
+            {
+                "webhook_url": webhook_url,
+                "status": "active" if webhook_url else "not_configured",
+                "message": "Current webhook configuration",
+            },
             psp_response=response
         )
         
     except WebhookError as e:
-        return WebhookResponse(
-            webhook_url="",
-            status="not_configured",
-            message="No webhook configured",
-            psp_response={}
-        )
+        return FastJSONResponse({
+            "webhook_url": "",
+            "status": "not_configured",
+            "message": "No webhook configured",
+            "psp_response": {}
+        })
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get webhook config: {str(e)}")
 
 @router.delete("/webhooks/config")
 def delete_webhook(
-    psp: Pix = Depends(get_psp),
+    receiver: Optional[str] = None,
+    receivers: ReceiverPool = Depends(get_receivers),
     api_key: str = Depends(get_api_key)
-) -> dict:
+) -> Response:
     """
     Delete webhook configuration. Requires API key authentication. # TODO: documentation
     """
     try:
-        response = psp.delete_webhook()
+        response = receivers.get(receiver).delete_webhook(raw=True)
         
-        return {
-            "status": "deleted",
-            "message": "Webhook deleted successfully",
-            "psp_response": response
-        }
+        return raw_json_response(
+            {
+                "status": "deleted",
+                "message": "Webhook deleted successfully",
+            },
+            psp_response=response
+        )
         
-    except WebhookError as e:
+    except (WebhookError, ReceiverError) as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to delete webhook: {str(e)}")
@@ -266,11 +440,31 @@ def receive_pix_webhook(
     """
     Recebe o webhook do PSP; atualiza o status local
     e (se configurado) encaminha para o backend com HMAC.
+    Reentregas idênticas e transições inválidas/no-op não escrevem no banco
+    nem são encaminhadas.
     """
+    event = (webhook.txid, webhook.status)
+    if event in recent_webhooks:
+        return {
+            "status": "ok",
+            "message": "Duplicate webhook ignored",
+            "txid": webhook.txid,
+            "new_status": webhook.status.value
+        }
+
     try:
-        payment = repo.set_status(webhook.txid, webhook.status)
+        payment, changed = repo.transition(webhook.txid, webhook.status)
         if not payment:
             raise HTTPException(status_code=404, detail="Payment not found")
+        recent_webhooks.add(event)
+
+        if not changed:
+            return {
+                "status": "ok",
+                "message": "Payment status unchanged",
+                "txid": webhook.txid,
+                "new_status": payment.status.value
+            }
 
         if BACKEND_WEBHOOK_URL and BACKEND_WEBHOOK_SECRET:
             payload = {
@@ -279,11 +473,7 @@ def receive_pix_webhook(
             }
             body = json.dumps(payload).encode()
             ts = str(int(time.time()))
-            sig = hmac.new(
-                BACKEND_WEBHOOK_SECRET.encode(),
-                f"{ts}.".encode() + body,
-                hashlib.sha256
-            ).hexdigest()
+            sig = _sign_payload(BACKEND_WEBHOOK_SECRET, ts, body)
 
             headers = {
                 "Content-Type": "application/json",
@@ -292,6 +482,7 @@ def receive_pix_webhook(
             }
 
             try:
+                import httpx
                 with httpx.Client(timeout=5.0) as cli:
                     cli.post(BACKEND_WEBHOOK_URL, headers=headers, content=body)
             except Exception:
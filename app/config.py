@@ -1,9 +1,10 @@
 # app/config.py
 from __future__ import annotations
 import os
+from functools import lru_cache
 from dotenv import load_dotenv
-from dataclasses import dataclass
-from typing import Optional
+from dataclasses import dataclass, replace
+from typing import Optional, List
 
 load_dotenv()
 
@@ -11,14 +12,28 @@ load_dotenv()
 class Settings: # NOTE: is it safe to leave the keys in this class??
     app_name: str = "PIX-Module"
     debug: bool = os.getenv("DEBUG", "0") == "1"
-    expiration: int = os.getenv("EXPIRATION")
+    expiration: int = int(os.getenv("EXPIRATION", "86400"))
+    expiration_grace: int = int(os.getenv("EXPIRATION_GRACE", "60"))
     database_url: Optional[str] = os.getenv("DATABASE_URL")
+    database_replica_urls: str = os.getenv("DATABASE_REPLICA_URLS", "")
+    database_replica_max_lag: float = float(os.getenv("DATABASE_REPLICA_MAX_LAG", "5"))
+    db_pool_min_size: int = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+    db_pool_max_size: int = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+    user_cache_size: int = int(os.getenv("USER_CACHE_SIZE", "10000"))
+    user_cache_ttl: float = float(os.getenv("USER_CACHE_TTL", "300"))
+    user_cache_warm: int = int(os.getenv("USER_CACHE_WARM", "0"))
     psp_client_id: Optional[str] = os.getenv("MODOBANK_CLIENT_ID")
     psp_client_secret: Optional[str] = os.getenv("MODOBANK_CLIENT_SECRET")
     psp_pfx_path: Optional[str] = os.getenv("MODOBANK_PFX_PATH")
+    psp_pfx_password: Optional[str] = os.getenv("MODOBANK_PFX_PASSWORD")
     psp_crt_path: Optional[str] = os.getenv("MODOBANK_CRT_PATH")
     psp_key_path: Optional[str] = os.getenv("MODOBANK_KEY_PATH")
     psp_pix_key: Optional[str] = os.getenv("RECEIVER_PIX_KEY")
+    psp_cert_reload_interval: float = float(os.getenv("MODOBANK_CERT_RELOAD_INTERVAL", "30"))
+    receiver_name: str = "default"
+    receiver_weight: int = 1
+    receiver_names: str = os.getenv("PSP_RECEIVERS", "")
+    receiver_routing: str = os.getenv("RECEIVER_ROUTING", "round_robin")
     auto_create: bool = True
 
     def __post_init__(self):
@@ -35,6 +50,9 @@ class Settings: # NOTE: is it safe to leave the keys in this class??
         
         missing_vars = [var_name for var_name, value in required_vars if not value]
         missing_certs = [var_name for var_name, value in cert_vars if not value]
+        if missing_certs and self.psp_pfx_path:
+            # a PFX bundle replaces the CRT/KEY pair
+            missing_certs = []
         
         if missing_vars:
             raise ValueError(f"Missing required environment variables: {', '.join(missing_vars)}")
@@ -43,4 +61,39 @@ class Settings: # NOTE: is it safe to leave the keys in this class??
         elif missing_certs and not self.debug:
             raise ValueError(f"Missing required certificate paths: {', '.join(missing_certs)}")
 
-settings = Settings()
+    def receivers(self) -> List[Settings]:
+        """
+        One Settings per receiver account listed in PSP_RECEIVERS (comma separated).
+        Each receiver reads its credentials from the usual variables suffixed with
+        its upper-cased name (e.g. MODOBANK_CLIENT_ID_LOJA1), falling back to the
+        unsuffixed ones. Without PSP_RECEIVERS there is a single 'default' receiver.
+        """
+        names = [name.strip() for name in self.receiver_names.split(",") if name.strip()]
+        if not names:
+            return [self]
+
+        def env(var: str, name: str, default: Optional[str]) -> Optional[str]:
+            return os.getenv(f"{var}_{name.upper()}", default)
+
+        return [
+            replace(
+                self,
+                receiver_name=name,
+                receiver_weight=int(env("RECEIVER_WEIGHT", name, "1")),
+                psp_client_id=env("MODOBANK_CLIENT_ID", name, self.psp_client_id),
+                psp_client_secret=env("MODOBANK_CLIENT_SECRET", name, self.psp_client_secret),
+                psp_pfx_path=env("MODOBANK_PFX_PATH", name, self.psp_pfx_path),
+                psp_pfx_password=env("MODOBANK_PFX_PASSWORD", name, self.psp_pfx_password),
+                psp_crt_path=env("MODOBANK_CRT_PATH", name, self.psp_crt_path),
+                psp_key_path=env("MODOBANK_KEY_PATH", name, self.psp_key_path),
+                psp_pix_key=env("RECEIVER_PIX_KEY", name, self.psp_pix_key),
+            )
+            for name in names
+        ]
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """
+    Build the Settings on first use instead of at import time
+    """
+    return Settings()
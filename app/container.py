@@ -1,18 +1,106 @@
 # app/container.py
 from __future__ import annotations
+import asyncio
+import logging
 from typing import Dict, Any
-from app.store.db import Database
-from app.store.repository import Repository
-from app.config import settings
-from app.services.pix import Pix
+from app.config import Settings, get_settings
+
+logger = logging.getLogger(__name__)
 
 container: Dict[str, Any] = {}
 
-def initialize_container() -> None:
-    db = Database(settings.database_url)
-    repo = Repository(db, auto_create=settings.auto_create)
+# seconds between two failed OAuth warm-up attempts of a receiver (doubles up to the max)
+WARM_UP_RETRY_MIN = 1.0
+WARM_UP_RETRY_MAX = 60.0
+
+def _build_repo(settings: Settings):
+    # NOTE: imported here so that the database driver is only loaded when the app starts
+    from app.store.backend import open_database
+    from app.store.repository import Repository
+
+    db = open_database(
+        settings.database_url,
+        min_size=settings.db_pool_min_size,
+        max_size=settings.db_pool_max_size,
+        replica_urls=[url.strip() for url in settings.database_replica_urls.split(",") if url.strip()],
+        max_lag=settings.database_replica_max_lag,
+    )
+    repo = Repository(
+        db,
+        auto_create=settings.auto_create,
+        user_cache_size=settings.user_cache_size,
+        user_cache_ttl=settings.user_cache_ttl,
+        default_expiration=settings.expiration,
+    )
+    if settings.user_cache_warm:
+        repo.warm_user_cache(settings.user_cache_warm)
+    return repo
+
+def _build_receiver(settings: Settings):
+    from app.services.pix import Pix
+    from app.services.receivers import Receiver
+
     psp = Pix(settings)
+    return Receiver(name=settings.receiver_name, psp=psp, weight=settings.receiver_weight)
+
+async def _warm_up_receiver(receiver) -> None:
+    """
+    Fetch the first OAuth token of 'receiver', retrying with backoff until the PSP answers
+    """
+    delay = WARM_UP_RETRY_MIN
+    while True:
+        try:
+            await asyncio.to_thread(receiver.psp.warm_up)
+            return
+        except Exception as e:
+            logger.warning("Receiver %r warm-up failed (%r), retrying in %.0fs", receiver.name, e, delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, WARM_UP_RETRY_MAX)
+
+async def _warm_up_receivers(receivers) -> None:
+    await asyncio.gather(*(_warm_up_receiver(receiver) for receiver in receivers.receivers.values()))
+    container["ready"] = True
+    logger.info("Every receiver is warm, ready to serve")
+
+async def initialize_container() -> None:
+    """
+    Open the database pool and start the background services; the PSP sessions
+    (first OAuth token of every receiver) warm up in a background task, so the app
+    serves /healthz right away and /readyz turns ready once every receiver is warm
+    """
+    from app.services.receivers import ReceiverPool
+    from app.services.expiry import ExpirationSweeper
+    from app.services.notifier import StatusNotifier
+    from app.store.repository import STATUS_CHANNEL
+
+    settings = get_settings()
+    container["ready"] = False
+    repo = await asyncio.to_thread(_build_repo, settings)
+    receivers = ReceiverPool([_build_receiver(receiver) for receiver in settings.receivers()], policy=settings.receiver_routing)
+    sweeper = ExpirationSweeper(repo, receivers, grace=settings.expiration_grace)
+    await asyncio.to_thread(sweeper.start)
+    notifier = StatusNotifier(repo.db, STATUS_CHANNEL)
+    notifier.start(asyncio.get_running_loop())
     
     container["repo"] = repo
-    container["psp"] = psp
+    container["receivers"] = receivers
+    container["sweeper"] = sweeper
+    container["notifier"] = notifier
+    container["warm_up"] = asyncio.create_task(_warm_up_receivers(receivers))
+
+def shutdown_container() -> None:
+    container["ready"] = False
+    if "warm_up" in container:
+        container.pop("warm_up").cancel()
+    if "notifier" in container:
+        container.pop("notifier").stop()
+    if "sweeper" in container:
+        container.pop("sweeper").stop()
+    if "receivers" in container:
+        container.pop("receivers").close()
+    if "repo" in container:
+        container.pop("repo").db.close()
 
+def is_ready() -> bool:
+    repo = container.get("repo")
+    return bool(container.get("ready")) and repo is not None and repo.db.is_connected()
@@ -1,16 +1,26 @@
 # app/main.py
 from __future__ import annotations
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from app.config import settings
-from app.container import initialize_container
+from app.config import get_settings
+from app.container import initialize_container, shutdown_container
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await initialize_container()
+    yield
+    shutdown_container()
 
 
 def create_app() -> FastAPI:
-    initialize_container()
+    settings = get_settings()
     
-    app = FastAPI(title=settings.app_name,debug=settings.debug,docs_url="/")
+    app = FastAPI(title=settings.app_name,debug=settings.debug,docs_url="/",lifespan=lifespan)
      
+    from app.api.health import router as health_router
     from app.api.v1.router import router as api_router
+    app.include_router(health_router)
     app.include_router(api_router)
     
     return app
@@ -3,13 +3,52 @@ from __future__ import annotations
 from pydantic import BaseModel, Field, EmailStr
 from pydantic_br import CPF
 from enum import Enum
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
+from datetime import datetime
 
 class PaymentStatus(str, Enum):
     ACTIVE = "ATIVA"
     CONCLUDED = "CONCLUIDA"
     REMOVED_BY_USER = "REMOVIDA_PELO_USUARIO_RECEBEDOR"
     REMOVED_BY_PSP = "REMOVIDA_PELO_PSP"
+    EXPIRED = "EXPIRADA" # local only: the PSP keeps expired charges as ATIVA
+
+    @classmethod
+    def from_psp(cls, psp_status: str) -> PaymentStatus:
+        """
+        Map the 'status' of a PSP charge to a PaymentStatus (unknown values are ATIVA)
+        """
+        psp_status = psp_status.upper()
+        if psp_status in ["CONCLUIDA"]:
+            return cls.CONCLUDED
+        elif psp_status in ["ATIVA"]:
+            return cls.ACTIVE
+        elif psp_status in ["REMOVIDA_PELO_USUARIO_RECEBEDOR"]:
+            return cls.REMOVED_BY_USER
+        elif psp_status in ["REMOVIDA_PELO_PSP"]:
+            return cls.REMOVED_BY_PSP
+        return cls.ACTIVE
+
+    def predecessors(self) -> Tuple[PaymentStatus, ...]:
+        """
+        Statuses a payment may move to this one from (see ALLOWED_TRANSITIONS)
+        """
+        return ALLOWED_TRANSITIONS[self]
+
+# status -> statuses it can be reached from; nothing goes back to ATIVA and
+# CONCLUIDA/REMOVIDA_* are final (EXPIRADA is local, so the PSP may still settle it)
+ALLOWED_TRANSITIONS: Dict[PaymentStatus, Tuple[PaymentStatus, ...]] = {
+    PaymentStatus.ACTIVE: (),
+    PaymentStatus.EXPIRED: (PaymentStatus.ACTIVE,),
+    PaymentStatus.CONCLUDED: (PaymentStatus.ACTIVE, PaymentStatus.EXPIRED),
+    PaymentStatus.REMOVED_BY_USER: (PaymentStatus.ACTIVE, PaymentStatus.EXPIRED),
+    PaymentStatus.REMOVED_BY_PSP: (PaymentStatus.ACTIVE, PaymentStatus.EXPIRED),
+}
+
+FINAL_STATUSES = frozenset(
+    status for status in PaymentStatus
+    if not any(status in predecessors for predecessors in ALLOWED_TRANSITIONS.values())
+)
 
 class CreateUserRequest(BaseModel):
     # password
@@ -35,6 +74,7 @@ class CreatePaymentRequest(BaseModel):
     cpf: CPF
     name: str
     email: str
+    receiver: Optional[str] = Field(None, description="Receiver account to charge through (routed automatically if omitted)")
     # aditional info
 
 class PaymentResponse(BaseModel): # TODO: RFC-3339 to unix epoch or another postgresql supported fmt
@@ -44,6 +84,20 @@ class PaymentResponse(BaseModel): # TODO: RFC-3339 to unix epoch or another post
     user_cpf: CPF
     amount: float = Field(..., gt=0, description="Amount in BRL")
     pixCopiaECola: str
+    receiver: Optional[str] = None
+
+class PaymentEventResponse(BaseModel):
+    txid: str
+    old_status: Optional[PaymentStatus] = None
+    new_status: PaymentStatus
+    created_at: datetime
+
+class RollupBucketResponse(BaseModel):
+    bucket: datetime
+    status: PaymentStatus
+    user_cpf: Optional[str] = None
+    count: int
+    amount: int = Field(..., description="Sum of the amounts in cents")
 
 class PaymentStatusUpdate(BaseModel):
     status: PaymentStatus
@@ -0,0 +1,33 @@
+# app/services/dedup.py
+from __future__ import annotations
+import threading
+from collections import OrderedDict
+from typing import Hashable
+
+
+class RecentEvents:
+    """
+    Bounded LRU set of recently processed events, used to drop exact duplicates
+    (e.g. PSP webhook redeliveries) before they reach the database
+    """
+    def __init__(self, maxsize: int = 10000):
+        self.maxsize = maxsize
+        self._events: OrderedDict[Hashable, None] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, event: Hashable) -> bool:
+        with self._lock:
+            if event in self._events:
+                self._events.move_to_end(event)
+                return True
+            return False
+
+    def add(self, event: Hashable) -> None:
+        with self._lock:
+            self._events[event] = None
+            self._events.move_to_end(event)
+            if len(self._events) > self.maxsize:
+                self._events.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._events)
@@ -0,0 +1,139 @@
+# app/services/expiry.py
+from __future__ import annotations
+import heapq
+import logging
+import threading
+import time
+from typing import List, Optional, Tuple, TYPE_CHECKING
+from app.models.schemas import PaymentStatus
+
+if TYPE_CHECKING:
+    from app.store.repository import Repository
+    from app.services.receivers import ReceiverPool
+
+logger = logging.getLogger(__name__)
+
+
+class ExpirationSweeper:
+    """
+    Marks ATIVA charges as EXPIRADA when their 'calendario.expiracao' lapses, without
+    calling the PSP.
+
+    Deadlines live in a min-heap (monotonic clock) loaded at startup from the
+    'payments_active_expires_at' partial index and fed by every new charge. A single
+    thread sleeps until the earliest deadline and expires every due charge with one
+    batched UPDATE.
+
+    Charges that were already overdue by more than 'grace' seconds at startup lapsed
+    while the app was down (so their webhooks may have been missed): those are
+    confirmed with one PSP lookup each instead of being expired blindly, by a second
+    thread running alongside the heap loop, 'batch_size' charges at a time. Each batch
+    is re-read first, so the charges another instance already settled are skipped.
+    """
+    def __init__(self, repo: Repository, receivers: ReceiverPool, grace: int = 60, batch_size: int = 500):
+        self.repo = repo
+        self.receivers = receivers
+        self.grace = grace
+        self.batch_size = batch_size
+        self._heap: List[Tuple[float, str]] = []
+        self._ambiguous: List[Tuple[str, Optional[str]]] = []
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+        self._confirm_thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        now = time.monotonic()
+        for txid, receiver, seconds_left in self.repo.active_expirations():
+            if seconds_left < -self.grace:
+                self._ambiguous.append((txid, receiver))
+            else:
+                self._heap.append((now + seconds_left, txid))
+        heapq.heapify(self._heap)
+
+        self._thread = threading.Thread(target=self._run, name="expiration-sweeper", daemon=True)
+        self._thread.start()
+        if self._ambiguous:
+            self._confirm_thread = threading.Thread(target=self._confirm_ambiguous, name="expiration-confirm", daemon=True)
+            self._confirm_thread.start()
+
+    def stop(self) -> None:
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        for thread in (self._thread, self._confirm_thread):
+            if thread:
+                thread.join(timeout=5)
+
+    def schedule(self, txid: str, seconds_left: float) -> None:
+        with self._condition:
+            deadline = time.monotonic() + seconds_left
+            heapq.heappush(self._heap, (deadline, txid))
+            if self._heap[0][1] == txid:
+                self._condition.notify()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                due = self._wait_for_due()
+                if due is None:
+                    return
+
+            try:
+                self.repo.expire_payments(due)
+            except Exception:
+                logger.exception("Failed to expire %d payments, retrying", len(due))
+                with self._condition:
+                    retry_at = time.monotonic() + 5
+                    for txid in due:
+                        heapq.heappush(self._heap, (retry_at, txid))
+
+    def _wait_for_due(self) -> Optional[List[str]]:
+        """
+        Block (holding the condition) until at least one deadline is due; pop up to 'batch_size' of them
+        """
+        while not self._stopped:
+            now = time.monotonic()
+            if self._heap and self._heap[0][0] <= now:
+                due = []
+                while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+                    due.append(heapq.heappop(self._heap)[1])
+                return due
+            self._condition.wait(self._heap[0][0] - now if self._heap else None)
+        return None
+
+    def _confirm_ambiguous(self) -> None:
+        ambiguous, self._ambiguous = self._ambiguous, []
+        for start in range(0, len(ambiguous), self.batch_size):
+            if self._stopped:
+                return
+            batch = ambiguous[start:start + self.batch_size]
+            try:
+                active = self.repo.active_txids([txid for txid, _ in batch])
+            except Exception:
+                logger.exception("Failed to read the status of %d overdue payments", len(batch))
+                continue
+
+            expired = []
+            for txid, receiver in batch:
+                if self._stopped:
+                    return
+                if txid not in active:
+                    continue
+                try:
+                    response = self.receivers.get(receiver).detail_immediate_charge(txid)
+                    status = PaymentStatus.from_psp(response.get("status", ""))
+                    if status == PaymentStatus.ACTIVE:
+                        expired.append(txid)
+                    else:
+                        self.repo.set_status(txid, status)
+                except Exception:
+                    logger.exception("Failed to confirm the status of %s", txid)
+
+            try:
+                self.repo.expire_payments(expired)
+            except Exception:
+                logger.exception("Failed to expire %d payments", len(expired))
@@ -0,0 +1,88 @@
+# app/services/notifier.py
+from __future__ import annotations
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Set, TYPE_CHECKING
+from app.models.schemas import PaymentStatus
+
+if TYPE_CHECKING:
+    from app.store.backend import StorageBackend
+
+logger = logging.getLogger(__name__)
+
+
+class StatusNotifier:
+    """
+    Fans payment status changes out to the clients waiting on them.
+
+    One thread per app instance holds a single LISTEN connection on the status
+    channel and hands each '<txid>:<status>' notification to the event loop, which
+    pushes it to the queues subscribed to that txid. A None is pushed to every
+    queue after each (re)connection, meaning "re-read the status, you may have
+    missed a change".
+    """
+    def __init__(self, db: StorageBackend, channel: str):
+        self.db = db
+        self.channel = channel
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+        self._thread = threading.Thread(target=self._run, name="status-notifier", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def subscribe(self, txid: str) -> asyncio.Queue:
+        """
+        Queue that receives the new PaymentStatus of 'txid' (call from the event loop)
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(txid, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, txid: str, queue: asyncio.Queue) -> None:
+        queues = self._subscribers.get(txid)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[txid]
+
+    @contextmanager
+    def subscription(self, txid: str) -> Iterator[asyncio.Queue]:
+        queue = self.subscribe(txid)
+        try:
+            yield queue
+        finally:
+            self.unsubscribe(txid, queue)
+
+    def __len__(self) -> int:
+        return sum(len(queues) for queues in self._subscribers.values())
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                for payload in self.db.listen(self.channel, self._stopped):
+                    self._loop.call_soon_threadsafe(self._dispatch, payload)
+            except Exception:
+                logger.exception("Lost the LISTEN connection on %s, reconnecting", self.channel)
+                self._stopped.wait(1)
+
+    def _dispatch(self, payload: Optional[str]) -> None:
+        if payload is None:
+            for queues in self._subscribers.values():
+                for queue in queues:
+                    queue.put_nowait(None)
+            return
+
+        txid, _, status = payload.rpartition(":")
+        for queue in self._subscribers.get(txid, ()):
+            queue.put_nowait(PaymentStatus(status))
@@ -6,7 +6,8 @@ import json
 import requests
 from datetime import datetime, timezone, timedelta
 from app.config import Settings
-from typing import Optional
+from app.services.tls import ClientCertificate, MutualTLSAdapter
+from typing import Iterator, Optional, Union
 from urllib.parse import urlparse
 
 import urllib3
@@ -63,17 +64,19 @@ class Pix:
         }
         self.domain = "https://v3.qrcodes.sulcredi.coop.br"
 
-        crt_path = self.api_keys['API_CRT_PATH']
-        key_path = self.api_keys['API_KEY_PATH']
-
-        if crt_path and key_path:
-            self.certificate = (crt_path, key_path)
-        else:
-            self.certificate = None
+        # NOTE: parsed once into an SSLContext shared by every connection (see app/services/tls.py)
+        self.certificate = ClientCertificate(
+            crt_path=self.api_keys['API_CRT_PATH'],
+            key_path=self.api_keys['API_KEY_PATH'],
+            pfx_path=settings.psp_pfx_path,
+            pfx_password=settings.psp_pfx_password,
+        )
 
         self.pix_key = self.api_keys['REC_PIX_KEY']
         self._bearer: Optional[str] = None
         self._bearer_expires_at: Optional[datetime] = None
+        self.session = requests.Session()
+        self.session.mount("https://", MutualTLSAdapter(self.certificate, reload_interval=settings.psp_cert_reload_interval))
 
     @property
     def bearer(self) -> str:
@@ -85,6 +88,16 @@ class Pix:
             self._bearer_expires_at = datetime.now(timezone.utc) + timedelta(seconds=300)
         return self._bearer
 
+    def warm_up(self) -> None:
+        """
+        Fetch the first OAuth token so that the PSP connection is already
+        open when the first charge arrives
+        """
+        _ = self.bearer
+
+    def close(self) -> None:
+        self.session.close()
+
     def create_immediate_charge(self,
                          amount: str,
                          cpf: str,
@@ -129,7 +142,7 @@ class Pix:
 
         try:
             # NOTE: read online this 'verify=False' is risky but it doesn't work without it
-            response = requests.post(url, headers=headers, json=data, cert=self.certificate, verify=False)
+            response = self.session.post(url, headers=headers, json=data, verify=False)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:           
@@ -137,15 +150,23 @@ class Pix:
             raise ChargeError(response.status_code)
 
 
-    def list_immediate_charges(self, inicio: str, fim: str) -> dict:
+    def list_immediate_charges(self,
+                               inicio: str,
+                               fim: str,
+                               raw: bool = False,
+                               page: Optional[int] = None,
+                               page_size: Optional[int] = None) -> Union[dict, bytes]:
         """ 
         List immediate charges between 'inicio' and 'fim'
 
         Parameters:
             inicio (str): date in 'yyyy-mm-dd-hh-mm-ss' lookup starting point
             fim (str): date in 'yyyy-mm-dd-hh-mm-ss' lookup date limit
+            raw (bool, optional): return the undecoded JSON body instead of a dict
+            page (int, optional): page to fetch ('paginacao.paginaAtual', starts at 0)
+            page_size (int, optional): charges per page ('paginacao.itensPorPagina')
         Returns:
-            (dict): the actual response of the PSP Pix API
+            (dict | bytes): the actual response of the PSP Pix API
         """
         if not (self._date_format_is_valid(inicio) and self._date_format_is_valid(fim)):     
             # TODO: better exception handling
@@ -162,16 +183,42 @@ class Pix:
             "inicio": self._to_rfc3339(inicio),
             "fim": self._to_rfc3339(fim)
         }
+        if page is not None:
+            payload["paginacao.paginaAtual"] = page
+        if page_size is not None:
+            payload["paginacao.itensPorPagina"] = page_size
         try:
             # NOTE: read online this 'verify=False' is risky but it doesn't work without it
-            response = requests.get(url, headers=headers, params=payload, cert=self.certificate, verify=False)
+            response = self.session.get(url, headers=headers, params=payload, verify=False)
             response.raise_for_status()
-            return response.json()
+            return response.content if raw else response.json()
         except requests.exceptions.RequestException as e:           
             # TODO: better exception handling
             raise ChargeError(response.status_code)
 
 
+    def iter_immediate_charges(self, inicio: str, fim: str, page_size: int = 1000) -> Iterator[dict]:
+        """ 
+        Iterate over every immediate charge between 'inicio' and 'fim', one PSP page at a time
+
+        Parameters:
+            inicio (str): date in 'yyyy-mm-dd-hh-mm-ss' lookup starting point
+            fim (str): date in 'yyyy-mm-dd-hh-mm-ss' lookup date limit
+            page_size (int, optional): charges fetched per request
+        Returns:
+            (Iterator[dict]): the 'cobs' of each page
+        """
+        page = 0
+        while True:
+            response = self.list_immediate_charges(inicio, fim, page=page, page_size=page_size)
+            yield from response.get("cobs", [])
+
+            pages = response.get("parametros", {}).get("paginacao", {}).get("quantidadeDePaginas", 1)
+            page += 1
+            if page >= pages:
+                return
+
+
     # NOTE: not tested after refactor
     def detail_immediate_charge(self, txid: str) -> str: # TODO: better typing
         """ 
@@ -196,7 +243,7 @@ class Pix:
         }
         try:
             # NOTE: read online this 'verify=False' is risky but it doesn't work without it
-            response = requests.get(url, headers=headers, cert=self.certificate, verify=False)
+            response = self.session.get(url, headers=headers, verify=False)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:           
@@ -212,26 +259,28 @@ class Pix:
         except Exception:
             raise WebhookError(400)
 
-    def create_webhook(self, webhook_url: str) -> dict:
+    def create_webhook(self, webhook_url: str, raw: bool = False) -> Union[dict, bytes]:
         self._validate_webhook_url(webhook_url)
         url = f"{self.domain}/webhook/{self.pix_key}"
         headers = {"Authorization": f"Bearer {self.bearer}", "Content-Type": "application/json"}
         data = {"webhookUrl": webhook_url}
         
         try:
-            response = requests.put(url, headers=headers, json=data, cert=self.certificate, verify=False)
+            response = self.session.put(url, headers=headers, json=data, verify=False)
             response.raise_for_status()
-            return response.json()
+            return response.content if raw else response.json()
         
         except requests.exceptions.RequestException:
             raise WebhookError(502)
 
-    def delete_webhook(self) -> dict:
+    def delete_webhook(self, raw: bool = False) -> Union[dict, bytes]:
         """
         Delete the existing webhook for this PIX key.
         
+        Parameters:
+            raw (bool, optional): return the undecoded JSON body instead of a dict
         Returns:
-            (dict): the actual response of the PSP Pix API
+            (dict | bytes): the actual response of the PSP Pix API
         """
         url = f"{self.domain}/webhook/{self.pix_key}"
         
@@ -241,19 +290,21 @@ class Pix:
         }
         
         try:
-            response = requests.delete(url, headers=headers, cert=self.certificate, verify=False)
+            response = self.session.delete(url, headers=headers, verify=False)
             response.raise_for_status()
-            return response.json()
+            return response.content if raw else response.json()
         except requests.exceptions.RequestException as e:            
             raise WebhookError(response.status_code)
 
 
-    def get_webhook(self) -> dict:
+    def get_webhook(self, raw: bool = False) -> Union[dict, bytes]:
         """
         Get the current webhook configuration for this PIX key.
         
+        Parameters:
+            raw (bool, optional): return the undecoded JSON body instead of a dict
         Returns:
-            (dict): the actual response of the PSP Pix API
+            (dict | bytes): the actual response of the PSP Pix API
         """
         url = f"{self.domain}/webhook/{self.pix_key}"
         
@@ -263,9 +314,9 @@ class Pix:
         }
         
         try:
-            response = requests.get(url, headers=headers, cert=self.certificate, verify=False)
+            response = self.session.get(url, headers=headers, verify=False)
             response.raise_for_status()
-            return response.json()
+            return response.content if raw else response.json()
         except requests.exceptions.RequestException as e:            
             raise WebhookError(response.status_code)
 
@@ -289,12 +340,13 @@ class Pix:
         
         try:
             # NOTE: read online this 'verify=False' is risky but it doesn't work without it
-            response = requests.post(url, json=data, headers=headers, cert=self.certificate, verify=False)
+            response = self.session.post(url, json=data, headers=headers, verify=False)
             response.raise_for_status()
             return response.json()['access_token']
         except requests.exceptions.RequestException as e:             
             # TODO: better exception handling
-            raise AuthenticationError(response.status_code)
+            # NOTE: no response when the PSP is unreachable
+            raise AuthenticationError(getattr(e.response, "status_code", None))
 
     def _is_token_expired(self) -> bool:
         """ 
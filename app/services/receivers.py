@@ -0,0 +1,99 @@
+# app/services/receivers.py
+from __future__ import annotations
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional
+from app.services.pix import Pix, PixError
+
+ROUTING_POLICIES = ("tenant", "round_robin", "least_loaded")
+
+class ReceiverError(PixError):
+    def __init__(self, name):
+        message = "{ 'Status': 400, 'Message': 'Unknown receiver " + repr(name) + ".' } "
+        super(ReceiverError, self).__init__(message)
+
+@dataclass
+class Receiver:
+    name: str
+    psp: Pix
+    weight: int = 1
+    in_flight: int = 0
+    current_weight: int = 0
+
+
+class ReceiverPool:
+    """
+    Set of named receiver accounts (PIX key + PSP credentials), each one with its
+    own Pix instance, OAuth token and connection pool.
+
+    Charges are routed by 'policy':
+        tenant: the receiver asked by the caller, otherwise the default one
+        round_robin: smooth weighted round-robin over the receiver weights
+        least_loaded: the receiver with the fewest in-flight charges per weight
+    An explicit receiver asked by the caller is always honored.
+    """
+    def __init__(self, receivers: List[Receiver], policy: str = "round_robin"):
+        if not receivers:
+            raise ValueError("At least one receiver is required")
+        if policy not in ROUTING_POLICIES:
+            raise ValueError(f"Unknown receiver routing policy: {policy}")
+        for receiver in receivers:
+            # least_loaded divides by the weight and round-robin needs it positive
+            if receiver.weight < 1:
+                raise ValueError(f"Receiver {receiver.name!r} weight must be at least 1 (RECEIVER_WEIGHT_{receiver.name.upper()}): {receiver.weight}")
+
+        self.receivers: Dict[str, Receiver] = {r.name: r for r in receivers}
+        self.default = receivers[0].name
+        self.policy = policy
+        self._lock = threading.Lock()
+
+    def get(self, name: Optional[str] = None) -> Pix:
+        """
+        Pix instance of the receiver 'name' (the default receiver when None)
+        """
+        receiver = self.receivers.get(name or self.default)
+        if not receiver:
+            raise ReceiverError(name)
+        return receiver.psp
+
+    def select(self, tenant: Optional[str] = None) -> Receiver:
+        if tenant:
+            if tenant not in self.receivers:
+                raise ReceiverError(tenant)
+            return self.receivers[tenant]
+
+        if self.policy == "tenant" or len(self.receivers) == 1:
+            return self.receivers[self.default]
+
+        with self._lock:
+            if self.policy == "least_loaded":
+                return min(self.receivers.values(), key=lambda r: r.in_flight / r.weight)
+
+            total = 0
+            best: Optional[Receiver] = None
+            for receiver in self.receivers.values():
+                receiver.current_weight += receiver.weight
+                total += receiver.weight
+                if best is None or receiver.current_weight > best.current_weight:
+                    best = receiver
+            best.current_weight -= total
+            return best
+
+    @contextmanager
+    def acquire(self, tenant: Optional[str] = None) -> Iterator[Receiver]:
+        """
+        Select a receiver and count the charge as in-flight while the block runs
+        """
+        receiver = self.select(tenant)
+        with self._lock:
+            receiver.in_flight += 1
+        try:
+            yield receiver
+        finally:
+            with self._lock:
+                receiver.in_flight -= 1
+
+    def close(self) -> None:
+        for receiver in self.receivers.values():
+            receiver.psp.close()
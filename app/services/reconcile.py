@@ -0,0 +1,127 @@
+# app/services/reconcile.py
+from __future__ import annotations
+import csv
+import heapq
+import tempfile
+from dataclasses import dataclass, asdict, fields
+from decimal import Decimal
+from typing import IO, Dict, Iterable, Iterator, List, Optional, Tuple
+import orjson
+from app.models.schemas import PaymentStatus
+from app.store.repository import Payment
+
+MISSING_LOCAL = "missing_local"
+MISSING_PSP = "missing_psp"
+STATUS_MISMATCH = "status_mismatch"
+AMOUNT_MISMATCH = "amount_mismatch"
+
+
+@dataclass
+class Diff:
+    txid: str
+    kind: str
+    psp_status: Optional[str] = None
+    local_status: Optional[str] = None
+    psp_amount: Optional[int] = None
+    local_amount: Optional[int] = None
+
+
+def _psp_amount(charge: dict) -> Optional[int]:
+    original = charge.get("valor", {}).get("original")
+    return int(Decimal(original) * 100) if original else None
+
+
+def sorted_by_txid(charges: Iterable[dict], run_size: int = 100_000) -> Iterator[dict]:
+    """
+    External merge sort of the PSP charges by txid: sorts runs of 'run_size' charges
+    in memory, spills each run to a temporary NDJSON file and merges the runs lazily,
+    so memory stays bounded by 'run_size' whatever the number of charges
+    """
+    runs: List[IO[bytes]] = []
+    run: List[Tuple[str, bytes]] = []
+
+    def spill() -> None:
+        run.sort(key=lambda item: item[0])
+        spool = tempfile.TemporaryFile()
+        spool.writelines(line + b"\n" for _, line in run)
+        spool.seek(0)
+        runs.append(spool)
+        run.clear()
+
+    for charge in charges:
+        run.append((charge.get("txid", ""), orjson.dumps(charge)))
+        if len(run) >= run_size:
+            spill()
+
+    if not runs:
+        run.sort(key=lambda item: item[0])
+        for _, line in run:
+            yield orjson.loads(line)
+        return
+
+    if run:
+        spill()
+    try:
+        readers = [(orjson.loads(line) for line in spool) for spool in runs]
+        yield from heapq.merge(*readers, key=lambda charge: charge.get("txid", ""))
+    finally:
+        for spool in runs:
+            spool.close()
+
+
+def merge_join(charges: Iterator[dict], payments: Iterator[Payment]) -> Iterator[Diff]:
+    """
+    Compare two txid-ordered streams (PSP charges and local payments) in one pass
+
+    Returns:
+        (Iterator[Diff]): one Diff per missing row, status or amount mismatch
+    """
+    charge = next(charges, None)
+    payment = next(payments, None)
+
+    while charge is not None or payment is not None:
+        if payment is None or (charge is not None and charge.get("txid", "") < payment.txid):
+            yield Diff(txid=charge.get("txid", ""), kind=MISSING_LOCAL, psp_status=charge.get("status"), psp_amount=_psp_amount(charge))
+            charge = next(charges, None)
+            continue
+
+        if charge is None or payment.txid < charge.get("txid", ""):
+            yield Diff(txid=payment.txid, kind=MISSING_PSP, local_status=payment.status.value, local_amount=payment.amount)
+            payment = next(payments, None)
+            continue
+
+        psp_status = PaymentStatus.from_psp(charge.get("status", ""))
+        psp_amount = _psp_amount(charge)
+        # EXPIRADA is local only: the PSP keeps reporting those charges as ATIVA
+        expired_locally = payment.status == PaymentStatus.EXPIRED and psp_status == PaymentStatus.ACTIVE
+        if psp_status != payment.status and not expired_locally:
+            yield Diff(txid=payment.txid, kind=STATUS_MISMATCH, psp_status=psp_status.value, local_status=payment.status.value,
+                       psp_amount=psp_amount, local_amount=payment.amount)
+        if psp_amount is not None and psp_amount != payment.amount:
+            yield Diff(txid=payment.txid, kind=AMOUNT_MISMATCH, psp_status=psp_status.value, local_status=payment.status.value,
+                       psp_amount=psp_amount, local_amount=payment.amount)
+
+        charge = next(charges, None)
+        payment = next(payments, None)
+
+
+class DiffWriter:
+    """
+    Writes Diff rows as CSV or NDJSON to a text file
+    """
+    def __init__(self, output: IO[str], fmt: str = "csv"):
+        if fmt not in ("csv", "ndjson"):
+            raise ValueError(f"Unknown report format: {fmt}")
+        self.output = output
+        self.fmt = fmt
+        self.counts: Dict[str, int] = {}
+        if fmt == "csv":
+            self._csv = csv.writer(output)
+            self._csv.writerow([field.name for field in fields(Diff)])
+
+    def write(self, diff: Diff) -> None:
+        self.counts[diff.kind] = self.counts.get(diff.kind, 0) + 1
+        if self.fmt == "csv":
+            self._csv.writerow(["" if value is None else value for value in asdict(diff).values()])
+        else:
+            self.output.write(orjson.dumps(asdict(diff)).decode() + "\n")
@@ -0,0 +1,193 @@
+# app/services/tls.py
+from __future__ import annotations
+import logging
+import os
+import ssl
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ClientCertificate:
+    """
+    Client certificate of the PSP mTLS link: a CRT/KEY pair or, without one, a PFX
+    (PKCS#12) bundle
+    """
+    crt_path: Optional[str] = None
+    key_path: Optional[str] = None
+    pfx_path: Optional[str] = None
+    pfx_password: Optional[str] = None
+
+    @property
+    def paths(self) -> List[str]:
+        if self.crt_path and self.key_path:
+            return [self.crt_path, self.key_path]
+        if self.pfx_path:
+            return [self.pfx_path]
+        return []
+
+    def mtimes(self) -> Tuple[float, ...]:
+        return tuple(os.stat(path).st_mtime for path in self.paths)
+
+    def load_into(self, context: ssl.SSLContext) -> None:
+        if self.crt_path and self.key_path:
+            context.load_cert_chain(self.crt_path, self.key_path)
+        elif self.pfx_path:
+            self._load_pfx_into(context)
+
+    def _load_pfx_into(self, context: ssl.SSLContext) -> None:
+        """
+        'ssl' only loads PEM files, so the PFX is converted to a private temporary
+        PEM file that is removed right after being loaded
+        """
+        try:
+            from cryptography.hazmat.primitives.serialization import Encoding, NoEncryption, PrivateFormat, pkcs12
+        except ImportError:
+            raise RuntimeError("MODOBANK_PFX_PATH requires the 'cryptography' package (pip install cryptography)")
+
+        with open(self.pfx_path, "rb") as pfx:
+            password = self.pfx_password.encode() if self.pfx_password else None
+            key, certificate, chain = pkcs12.load_key_and_certificates(pfx.read(), password)
+
+        fd, pem_path = tempfile.mkstemp(suffix=".pem")
+        try:
+            with os.fdopen(fd, "wb") as pem:
+                pem.write(key.private_bytes(Encoding.PEM, PrivateFormat.PKCS8, NoEncryption()))
+                for cert in [certificate, *(chain or [])]:
+                    pem.write(cert.public_bytes(Encoding.PEM))
+            context.load_cert_chain(pem_path)
+        finally:
+            os.unlink(pem_path)
+
+
+class _ResumableSSLSocket(ssl.SSLSocket):
+    # TLS 1.3 session tickets only arrive after the handshake, with the first reads
+    _has_ticket = False
+
+    def read(self, len: int = 1024, buffer=None):
+        data = super().read(len, buffer)
+        if not self._has_ticket:
+            self._has_ticket = self.context.remember(self)
+        return data
+
+    def close(self) -> None:
+        if not self._has_ticket:
+            self.context.remember(self)
+        super().close()
+
+
+class ResumableSSLContext(ssl.SSLContext):
+    """
+    Client SSLContext that resumes the last TLS session of each server on new
+    connections, so reconnects skip the full handshake (and the certificate
+    exchange) while the PSP still accepts the session
+    """
+    sslsocket_class = _ResumableSSLSocket
+
+    def __new__(cls, protocol: int = ssl.PROTOCOL_TLS_CLIENT, *args, **kwargs):
+        context = super().__new__(cls, protocol, *args, **kwargs)
+        context._sessions = {}
+        context._sessions_lock = threading.Lock()
+        return context
+
+    def remember(self, sock: ssl.SSLSocket) -> bool:
+        """
+        Keep the TLS session of 'sock' for the next connections to the same server
+
+        Returns:
+            (bool): True if the session carries a resumption ticket
+        """
+        session = sock.session if sock.server_hostname else None
+        if session is None:
+            return False
+        with self._sessions_lock:
+            self._sessions[sock.server_hostname] = session
+        return session.has_ticket
+
+    def wrap_socket(self, sock, server_side=False, do_handshake_on_connect=True,
+                    suppress_ragged_eofs=True, server_hostname=None, session=None):
+        if session is None and server_hostname:
+            with self._sessions_lock:
+                session = self._sessions.get(server_hostname)
+
+        tls_sock = super().wrap_socket(sock, server_side=server_side, do_handshake_on_connect=do_handshake_on_connect,
+                                       suppress_ragged_eofs=suppress_ragged_eofs, server_hostname=server_hostname,
+                                       session=session)
+        if do_handshake_on_connect:
+            self.remember(tls_sock)
+        return tls_sock
+
+
+def build_ssl_context(certificate: ClientCertificate) -> ResumableSSLContext:
+    """
+    SSLContext holding the parsed client certificate in memory
+
+    Parameters:
+        certificate (ClientCertificate): the client certificate files
+    Returns:
+        (ResumableSSLContext): context shared by every connection to the PSP
+    """
+    context = ResumableSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    # NOTE: same as 'verify=False', the PSP certificate does not validate
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    certificate.load_into(context)
+    return context
+
+
+class MutualTLSAdapter(HTTPAdapter):
+    """
+    requests adapter whose connections all share one ResumableSSLContext.
+
+    Every 'reload_interval' seconds a request checks the certificate files' mtimes;
+    when they change, a new context is built and the idle connections are dropped,
+    so a renewed certificate is picked up without a restart. A certificate that
+    fails to load (e.g. half-written) keeps the previous context until the next check.
+    """
+    def __init__(self, certificate: ClientCertificate, reload_interval: float = 30.0, **kwargs):
+        self.certificate = certificate
+        self.reload_interval = reload_interval
+        self.ssl_context = build_ssl_context(certificate)
+        self._mtimes = certificate.mtimes()
+        self._next_check = time.monotonic() + reload_interval
+        self._reload_lock = threading.Lock()
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs) -> None:
+        kwargs["ssl_context"] = self.ssl_context
+        super().init_poolmanager(*args, **kwargs)
+
+    def send(self, request, *args, **kwargs):
+        if time.monotonic() >= self._next_check:
+            self.reload_if_changed()
+        return super().send(request, *args, **kwargs)
+
+    def reload_if_changed(self) -> bool:
+        """
+        Rebuild the SSLContext if the certificate files changed
+
+        Returns:
+            (bool): True if a new certificate was loaded
+        """
+        with self._reload_lock:
+            self._next_check = time.monotonic() + self.reload_interval
+            try:
+                mtimes = self.certificate.mtimes()
+                if mtimes == self._mtimes:
+                    return False
+                context = build_ssl_context(self.certificate)
+            except Exception:
+                logger.exception("Failed to reload the PSP client certificate, keeping the current one")
+                return False
+
+            self.ssl_context, self._mtimes = context, mtimes
+            self.poolmanager.connection_pool_kw["ssl_context"] = context
+            self.poolmanager.clear()
+            logger.warning("Reloaded the PSP client certificate from %s", ", ".join(self.certificate.paths))
+            return True
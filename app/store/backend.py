@@ -0,0 +1,38 @@
+# app/store/backend.py
+from __future__ import annotations
+import threading
+from typing import Any, ContextManager, Iterator, List, Optional, Protocol, Tuple
+
+
+class StorageBackend(Protocol):
+    """
+    What the Repository needs from a database (app.store.db.Database for PostgreSQL,
+    app.store.sqlite.SqliteDatabase for SQLite). Queries use '%s' placeholders.
+    """
+    dialect: str
+
+    def connect(self) -> None: ...
+    def is_connected(self) -> bool: ...
+    def transaction(self) -> ContextManager[None]: ...
+    def read_your_writes(self) -> ContextManager[None]: ...
+    def execute(self, query: str, params: Optional[Tuple] = None) -> int: ...
+    def query_one(self, query: str, params: Optional[Tuple] = None, primary: bool = False) -> Optional[Tuple[Any, ...]]: ...
+    def query_all(self, query: str, params: Optional[Tuple] = None, primary: bool = False) -> List[Tuple[Any, ...]]: ...
+    def stream(self, query: str, params: Optional[Tuple] = None, batch_size: int = 1000, primary: bool = False) -> Iterator[Tuple[Any, ...]]: ...
+    def notify(self, channel: str, payloads: List[str]) -> None: ...
+    def listen(self, channel: str, stop: threading.Event) -> Iterator[Optional[str]]: ...
+    def close(self) -> None: ...
+
+
+def open_database(database_url: str, **kwargs) -> StorageBackend:
+    """
+    Backend for 'database_url': 'sqlite:///path/to.db' (or 'sqlite:///:memory:') uses
+    the embedded SQLite backend, anything else PostgreSQL. Only the chosen driver is
+    imported; PostgreSQL-only options (pools, replicas) are ignored by SQLite.
+    """
+    if database_url.startswith("sqlite:"):
+        from app.store.sqlite import SqliteDatabase
+        return SqliteDatabase(database_url)
+
+    from app.store.db import Database
+    return Database(database_url, **kwargs)
@@ -1,42 +1,226 @@
 # app/store/db.py
 from __future__ import annotations
+import itertools
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Iterator, Optional, Tuple, List
 import psycopg
-from typing import Any, Optional, Tuple, List
+from psycopg_pool import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+REPLICA_LAG_QUERY = """SELECT CASE
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END"""
+
+
+@dataclass
+class Replica:
+    url: str
+    pool: ConnectionPool
+    healthy: bool = False
+    lag: Optional[float] = None
 
 
 class Database: # TODO: improve error messages
-    def __init__(self, database_url: str):
+    """
+    PostgreSQL access through a pool on the primary and, optionally, one pool per
+    read replica.
+
+    'execute' and transactions always run on the primary. 'query_one'/'query_all'
+    go round-robin to the healthy replicas unless 'primary=True' is passed or the
+    caller is inside a 'read_your_writes()' block. A replica lagging more than
+    'max_lag' seconds (or failing the lag check) is removed from the rotation until
+    it catches up.
+    """
+    dialect = "postgresql"
+
+    def __init__(self,
+                 database_url: str,
+                 min_size: int = 1,
+                 max_size: int = 10,
+                 replica_urls: Optional[List[str]] = None,
+                 max_lag: float = 5.0,
+                 lag_check_interval: float = 2.0):
         self.database_url = database_url
-        self.connection: Optional[psycopg.Connection] = None
+        self.pool: Optional[ConnectionPool] = None
+        self.min_size = min_size
+        self.max_size = max_size
+        self.replica_urls = replica_urls or []
+        self.replicas: List[Replica] = []
+        self.max_lag = max_lag
+        self.lag_check_interval = lag_check_interval
+        self._transaction: ContextVar[Optional[psycopg.Connection]] = ContextVar(f"transaction_{id(self)}", default=None)
+        self._read_your_writes: ContextVar[bool] = ContextVar(f"read_your_writes_{id(self)}", default=False)
+        self._next_replica = itertools.count()
+        self._lag_monitor: Optional[threading.Thread] = None
+        self._closing = threading.Event()
+
+    def _create_pool(self, url: str) -> ConnectionPool:
+        return ConnectionPool(
+            url,
+            min_size=self.min_size,
+            max_size=self.max_size,
+            kwargs={"autocommit": True},
+            open=False,
+        )
 
     def connect(self) -> None:
-        if not self.connection or self.connection.closed:
-            self.connection = psycopg.connect(self.database_url, autocommit=True)
+        """
+        Open the primary pool (waiting until 'min_size' connections are ready) and the
+        replica pools, which only join the rotation after their first lag check
+        """
+        if not self.pool or self.pool.closed:
+            self.pool = self._create_pool(self.database_url)
+            self.pool.open(wait=True)
+
+        if self.replica_urls and not self.replicas:
+            for url in self.replica_urls:
+                pool = self._create_pool(url)
+                pool.open(wait=False)
+                self.replicas.append(Replica(url=url, pool=pool))
+            self._closing.clear()
+            self.check_replicas()
+            self._lag_monitor = threading.Thread(target=self._monitor_replicas, name="replica-lag-monitor", daemon=True)
+            self._lag_monitor.start()
 
-    def execute(self, query: str, params: Optional[Tuple] = None) -> None:
-        if not self.connection:
+    def is_connected(self) -> bool:
+        return bool(self.pool) and not self.pool.closed
+
+    def check_replicas(self) -> None:
+        for replica in self.replicas:
+            try:
+                with replica.pool.connection(timeout=self.lag_check_interval) as connection:
+                    row = connection.execute(REPLICA_LAG_QUERY).fetchone()
+                replica.lag = float(row[0])
+                healthy = replica.lag <= self.max_lag
+            except Exception:
+                replica.lag = None
+                healthy = False
+
+            if healthy != replica.healthy:
+                logger.warning("Replica %s %s rotation (lag: %s)", replica.pool.name, "joined" if healthy else "left", replica.lag)
+            replica.healthy = healthy
+
+    def _monitor_replicas(self) -> None:
+        while not self._closing.wait(self.lag_check_interval):
+            self.check_replicas()
+
+    @contextmanager
+    def read_your_writes(self) -> Iterator[None]:
+        """
+        Send every read issued inside the block to the primary
+        """
+        token = self._read_your_writes.set(True)
+        try:
+            yield
+        finally:
+            self._read_your_writes.reset(token)
+
+    def _read_pool(self, primary: bool) -> Optional[ConnectionPool]:
+        if primary or self._read_your_writes.get():
+            return self.pool
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return self.pool
+        return healthy[next(self._next_replica) % len(healthy)].pool
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """
+        Run every execute/query_* issued inside the block on the same primary
+        connection, in a single transaction (nested blocks become savepoints)
+        """
+        if not self.pool:
             raise RuntimeError("Database not connected")
-        
-        with self.connection.cursor() as cursor:
-            cursor.execute(query, params)
 
-    def query_one(self, query: str, params: Optional[Tuple] = None) -> Optional[Tuple[Any, ...]]:
-        if not self.connection:
+        connection = self._transaction.get()
+        if connection is not None:
+            with connection.transaction():
+                yield
+            return
+
+        with self.pool.connection() as connection:
+            token = self._transaction.set(connection)
+            try:
+                with connection.transaction():
+                    yield
+            finally:
+                self._transaction.reset(token)
+
+    @contextmanager
+    def _cursor(self, pool: Optional[ConnectionPool]) -> Iterator[psycopg.Cursor]:
+        if not pool:
             raise RuntimeError("Database not connected")
-        
-        with self.connection.cursor() as cursor:
+
+        connection = self._transaction.get()
+        if connection is not None:
+            with connection.cursor() as cursor:
+                yield cursor
+            return
+
+        with pool.connection() as connection, connection.cursor() as cursor:
+            yield cursor
+
+    def execute(self, query: str, params: Optional[Tuple] = None) -> int:
+        with self._cursor(self.pool) as cursor:
+            cursor.execute(query, params)
+            return cursor.rowcount
+
+    def query_one(self, query: str, params: Optional[Tuple] = None, primary: bool = False) -> Optional[Tuple[Any, ...]]:
+        with self._cursor(self._read_pool(primary)) as cursor:
             cursor.execute(query, params)
             return cursor.fetchone()
 
-    def query_all(self, query: str, params: Optional[Tuple] = None) -> List[Tuple[Any, ...]]:
-        if not self.connection:
-            raise RuntimeError("Database not connected")
-        
-        with self.connection.cursor() as cursor:
+    def query_all(self, query: str, params: Optional[Tuple] = None, primary: bool = False) -> List[Tuple[Any, ...]]:
+        with self._cursor(self._read_pool(primary)) as cursor:
             cursor.execute(query, params)
             return cursor.fetchall()
 
-    def close(self) -> None:
-        if self.connection:
-            self.connection.close()
+    def stream(self, query: str, params: Optional[Tuple] = None, batch_size: int = 1000, primary: bool = False) -> Iterator[Tuple[Any, ...]]:
+        """
+        Iterate over the rows of 'query' through a server-side cursor, fetching
+        'batch_size' rows at a time instead of loading the whole result
+        """
+        pool = self._read_pool(primary)
+        if not pool:
+            raise RuntimeError("Database not connected")
+
+        with pool.connection() as connection, connection.transaction():
+            with connection.cursor(name=f"stream_{threading.get_ident()}") as cursor:
+                cursor.itersize = batch_size
+                cursor.execute(query, params)
+                yield from cursor
 
+    def notify(self, channel: str, payloads: List[str]) -> None:
+        """
+        NOTIFY 'channel' once per payload; inside a transaction they are only
+        delivered on commit
+        """
+        if payloads:
+            self.execute("SELECT pg_notify(%s, payload) FROM unnest(%s::text[]) AS payload", (channel, payloads))
+
+    def listen(self, channel: str, stop: threading.Event) -> Iterator[Optional[str]]:
+        """
+        LISTEN on 'channel' with a dedicated (non pooled) primary connection and yield
+        each notification payload until 'stop' is set. Yields None once the LISTEN is
+        active, so callers can resync whatever they may have missed before.
+        """
+        with psycopg.connect(self.database_url, autocommit=True) as connection:
+            connection.execute(f"LISTEN {channel}")
+            yield None
+            while not stop.is_set():
+                for notify in connection.notifies(timeout=1.0):
+                    yield notify.payload
+
+    def close(self) -> None:
+        self._closing.set()
+        for replica in self.replicas:
+            replica.pool.close()
+        self.replicas = []
+        if self.pool:
+            self.pool.close()
@@ -1,11 +1,15 @@
 # app/store/repository.py
 from __future__ import annotations
-from typing import Optional
+from typing import Optional, List, Set, Tuple, Dict, Iterator, NamedTuple, TYPE_CHECKING
 from dataclasses import dataclass
+from datetime import date, datetime, timezone
 from pydantic import EmailStr
 from pydantic_br import CPF
-from app.store.db import Database
 from app.models.schemas import PaymentStatus
+from app.store.cache import TTLCache
+
+if TYPE_CHECKING:
+    from app.store.backend import StorageBackend
 
 SCHEMA = [
     """CREATE TABLE IF NOT EXISTS users (
@@ -22,9 +26,143 @@ SCHEMA = [
         pixCopiaECola TEXT NOT NULL,
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )"""
+    )""",
+    "ALTER TABLE payments ADD COLUMN IF NOT EXISTS receiver TEXT",
+    "ALTER TABLE payments ADD COLUMN IF NOT EXISTS previous_status TEXT",
+    "ALTER TABLE payments ADD COLUMN IF NOT EXISTS expires_at TIMESTAMP",
+    "CREATE INDEX IF NOT EXISTS payments_active_expires_at ON payments(expires_at) WHERE status = 'ATIVA'",
+    "CREATE INDEX IF NOT EXISTS payments_settled_updated_at ON payments(updated_at) WHERE status <> 'ATIVA'",
+    """CREATE TABLE IF NOT EXISTS payment_events (
+        txid TEXT NOT NULL,
+        old_status TEXT,
+        new_status TEXT NOT NULL,
+        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    ) PARTITION BY RANGE (created_at)""",
+    "CREATE INDEX IF NOT EXISTS payment_events_txid ON payment_events(txid, created_at)",
+    "CREATE TABLE IF NOT EXISTS payment_events_default PARTITION OF payment_events DEFAULT",
+    """CREATE TABLE IF NOT EXISTS payments_archive (
+        txid TEXT NOT NULL,
+        user_cpf VARCHAR(11),
+        amount INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        pixCopiaECola TEXT NOT NULL,
+        receiver TEXT,
+        created_at TIMESTAMP,
+        updated_at TIMESTAMP NOT NULL,
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (txid, updated_at)
+    ) PARTITION BY RANGE (updated_at)""",
+    "CREATE TABLE IF NOT EXISTS payments_archive_default PARTITION OF payments_archive DEFAULT",
+    """CREATE TABLE IF NOT EXISTS payment_rollups (
+        granularity TEXT NOT NULL,
+        bucket TIMESTAMP NOT NULL,
+        status TEXT NOT NULL,
+        user_cpf VARCHAR(11) NOT NULL DEFAULT '',
+        count BIGINT NOT NULL DEFAULT 0,
+        amount BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (granularity, bucket, status, user_cpf)
+    )""",
 ]
 
+SQLITE_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS users (
+        cpf VARCHAR(11) PRIMARY KEY,
+        email TEXT UNIQUE NOT NULL,
+        name TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""",
+    """CREATE TABLE IF NOT EXISTS payments (
+        txid TEXT PRIMARY KEY,
+        user_cpf VARCHAR(11) REFERENCES users(cpf) ON DELETE NO ACTION,
+        amount INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        pixCopiaECola TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        receiver TEXT,
+        previous_status TEXT,
+        expires_at TIMESTAMP
+    )""",
+    "CREATE INDEX IF NOT EXISTS payments_active_expires_at ON payments(expires_at) WHERE status = 'ATIVA'",
+    "CREATE INDEX IF NOT EXISTS payments_settled_updated_at ON payments(updated_at) WHERE status <> 'ATIVA'",
+    """CREATE TABLE IF NOT EXISTS payment_events (
+        txid TEXT NOT NULL,
+        old_status TEXT,
+        new_status TEXT NOT NULL,
+        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )""",
+    "CREATE INDEX IF NOT EXISTS payment_events_txid ON payment_events(txid, created_at)",
+    """CREATE TABLE IF NOT EXISTS payments_archive (
+        txid TEXT NOT NULL,
+        user_cpf VARCHAR(11),
+        amount INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        pixCopiaECola TEXT NOT NULL,
+        receiver TEXT,
+        created_at TIMESTAMP,
+        updated_at TIMESTAMP NOT NULL,
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (txid, updated_at)
+    )""",
+    """CREATE TABLE IF NOT EXISTS payment_rollups (
+        granularity TEXT NOT NULL,
+        bucket TIMESTAMP NOT NULL,
+        status TEXT NOT NULL,
+        user_cpf VARCHAR(11) NOT NULL DEFAULT '',
+        count BIGINT NOT NULL DEFAULT 0,
+        amount BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (granularity, bucket, status, user_cpf)
+    )""",
+]
+
+# the few statements that differ between the storage backends
+DIALECT_SQL = {
+    "postgresql": {
+        "schema": SCHEMA,
+        "seconds_from_now": "CURRENT_TIMESTAMP + make_interval(secs => %s)",
+        "seconds_after_creation": "created_at + make_interval(secs => %s)",
+        "seconds_left": "EXTRACT(EPOCH FROM expires_at - CURRENT_TIMESTAMP)",
+        "days_ago": "CURRENT_TIMESTAMP - make_interval(days => %s)",
+        "txid_order": 'txid COLLATE "C"',
+        # timestamptz bound -> the session time zone wall clock that CURRENT_TIMESTAMP stores
+        "utc_bound": "(%s::timestamptz AT TIME ZONE current_setting('TimeZone'))",
+        "bucket_hour": "date_trunc('hour', created_at)",
+        "bucket_day": "date_trunc('day', created_at)",
+    },
+    "sqlite": {
+        "schema": SQLITE_SCHEMA,
+        "seconds_from_now": "datetime(CURRENT_TIMESTAMP, '+' || %s || ' seconds')",
+        "seconds_after_creation": "datetime(created_at, '+' || %s || ' seconds')",
+        "seconds_left": "(julianday(expires_at) - julianday(CURRENT_TIMESTAMP)) * 86400",
+        "days_ago": "datetime(CURRENT_TIMESTAMP, '-' || %s || ' days')",
+        "txid_order": "txid COLLATE BINARY",
+        # CURRENT_TIMESTAMP is already UTC, the adapter converts aware bounds to UTC
+        "utc_bound": "%s",
+        "bucket_hour": "strftime('%Y-%m-%d %H:00:00', created_at)",
+        "bucket_day": "strftime('%Y-%m-%d 00:00:00', created_at)",
+    },
+}
+
+# range partitioning column of the monthly partitioned tables
+PARTITION_KEYS = {"payment_events": "created_at", "payments_archive": "updated_at"}
+
+# NOTIFY channel for status changes, payload '<txid>:<status>'
+STATUS_CHANNEL = "payment_status"
+
+# 'payment_rollups' keeps, per creation bucket, how many payments (and their amount) are
+# currently in each status, both for all users (user_cpf = '') and for each user
+ROLLUP_GRANULARITIES = ("hour", "day")
+
+# statuses that never change again, moved to 'payments_archive' after the retention window
+SETTLED_STATUSES = (
+    PaymentStatus.CONCLUDED.value,
+    PaymentStatus.REMOVED_BY_USER.value,
+    PaymentStatus.REMOVED_BY_PSP.value,
+    PaymentStatus.EXPIRED.value,
+)
+
+PAYMENT_COLUMNS = "txid, user_cpf, amount, status, pixCopiaECola, receiver"
+
 @dataclass
 class User:
     cpf: CPF
@@ -42,39 +180,487 @@ class Payment:
     amount: int
     status: PaymentStatus
     pixCopiaECola: str
+    receiver: Optional[str] = None
+
+@dataclass
+class PaymentEvent:
+    txid: str
+    old_status: Optional[PaymentStatus]
+    new_status: PaymentStatus
+    created_at: datetime
+
+@dataclass
+class RollupBucket:
+    bucket: datetime
+    status: PaymentStatus
+    count: int
+    amount: int
+    user_cpf: Optional[str] = None
+
+class _Transition(NamedTuple):
+    txid: str
+    user_cpf: Optional[str]
+    amount: int
+    created_at: datetime
+    old_status: Optional[str]
+    new_status: str
+
+def _truncate(moment: datetime, granularity: str) -> datetime:
+    if granularity == "day":
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+def _month_start(day: date) -> date:
+    return date(day.year, day.month, 1)
+
+def _next_month(day: date) -> date:
+    return date(day.year + day.month // 12, day.month % 12 + 1, 1)
 
 class Repository:
-    def __init__(self, db: Database, auto_create: bool = True):
+    def __init__(self,
+                 db: StorageBackend,
+                 auto_create: bool = True,
+                 user_cache_size: int = 10000,
+                 user_cache_ttl: float = 300.0,
+                 default_expiration: Optional[int] = None):
         self.db = db
+        self.default_expiration = default_expiration
+        self.sql = DIALECT_SQL[db.dialect]
+        # users are only ever inserted, so cached rows can only be stale up to the TTL
+        # if another instance wins an insert race
+        self.users: TTLCache[User] = TTLCache(maxsize=user_cache_size, ttl=user_cache_ttl)
         self.db.connect()
         if auto_create:
             self.ensure_schema()
 
     def ensure_schema(self) -> None:
-        for sql in SCHEMA:
+        for sql in self.sql["schema"]:
             self.db.execute(sql)
+        self.ensure_partitions()
+        if self.default_expiration:
+            self.backfill_expirations(self.default_expiration)
+
+    def backfill_expirations(self, expiration: int) -> int:
+        """
+        Set 'expires_at' to 'created_at' + 'expiration' seconds on the ATIVA payments
+        created before expiries were stored, so the sweeper picks them up
+
+        Returns:
+            (int): number of payments updated
+        """
+        return self.db.execute(
+            f"UPDATE payments SET expires_at = {self.sql['seconds_after_creation']} "
+            "WHERE status = 'ATIVA' AND expires_at IS NULL",
+            (expiration,),
+        )
+
+    def ensure_partitions(self, months_ahead: int = 2) -> None:
+        """
+        Create the monthly 'payment_events' partitions from the current month up to 'months_ahead'
+        (PostgreSQL only, SQLite tables are not partitioned)
+        """
+        if self.db.dialect != "postgresql":
+            return
+        month = _month_start(date.today())
+        for _ in range(months_ahead + 1):
+            self._ensure_month_partition("payment_events", month)
+            month = _next_month(month)
+
+    def _ensure_month_partition(self, table: str, month: date) -> None:
+        """
+        Create the 'month' partition of 'table'. If the app ran past the partitions created
+        ahead, rows of that month already sit in the DEFAULT partition and PostgreSQL refuses
+        the new partition, so the default is detached, its rows of that month moved into the
+        new partition and the default attached again, all in one transaction.
+        """
+        partition = f"{table}_y{month.year}m{month.month:02d}"
+        row = self.db.query_one("SELECT to_regclass(%s)", (partition,), primary=True)
+        if row and row[0]:
+            return
+
+        upper = _next_month(month)
+        key = PARTITION_KEYS[table]
+        with self.db.transaction():
+            # DETACH locks the table, so nothing can land in the default meanwhile
+            self.db.execute(f"ALTER TABLE {table} DETACH PARTITION {table}_default")
+            self.db.execute(
+                f"CREATE TABLE IF NOT EXISTS {partition} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{upper.isoformat()}')"
+            )
+            self.db.execute(
+                f"""WITH moved AS (
+                    DELETE FROM {table}_default WHERE {key} >= %s AND {key} < %s RETURNING *
+                )
+                INSERT INTO {partition} SELECT * FROM moved""",
+                (month, upper),
+            )
+            self.db.execute(f"ALTER TABLE {table} ATTACH PARTITION {table}_default DEFAULT")
+
+    def _record_transitions(self, transitions: List[_Transition]) -> None:
+        """
+        Append the transitions to 'payment_events', move their counts in 'payment_rollups'
+        and publish them on STATUS_CHANNEL; call inside the status change transaction
+        """
+        self.db.notify(STATUS_CHANNEL, [f"{t.txid}:{t.new_status}" for t in transitions])
+
+        values = ", ".join(["(%s, %s, %s)"] * len(transitions))
+        params = tuple(value for t in transitions for value in (t.txid, t.old_status, t.new_status))
+        self.db.execute(f"INSERT INTO payment_events(txid, old_status, new_status) VALUES {values}", params)
+
+        deltas: Dict[Tuple[str, datetime, str, str], List[int]] = {}
+        for t in transitions:
+            for granularity in ROLLUP_GRANULARITIES:
+                bucket = _truncate(t.created_at, granularity)
+                for user_cpf in {"", t.user_cpf or ""}:
+                    for status, sign in ((t.old_status, -1), (t.new_status, 1)):
+                        if status is None:
+                            continue
+                        delta = deltas.setdefault((granularity, bucket, status, user_cpf), [0, 0])
+                        delta[0] += sign
+                        delta[1] += sign * t.amount
+
+        # sorted so that concurrent transactions lock the rollup rows in the same order
+        rows = [(*key, *delta) for key, delta in sorted(deltas.items()) if delta[0] or delta[1]]
+        if not rows:
+            return
+        values = ", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(rows))
+        self.db.execute(
+            f"""INSERT INTO payment_rollups(granularity, bucket, status, user_cpf, count, amount) VALUES {values}
+            ON CONFLICT (granularity, bucket, status, user_cpf) DO UPDATE
+            SET count = payment_rollups.count + EXCLUDED.count, amount = payment_rollups.amount + EXCLUDED.amount""",
+            tuple(value for row in rows for value in row),
+        )
 
     def get_or_create_user(self, cpf: CPF, email: EmailStr, name: str) -> User:
+        user = self.users.get(cpf)
+        if user is not None:
+            return user
+
         row = self.db.query_one("SELECT cpf, email, name FROM users WHERE cpf=%s", (cpf,))
         if row:
-            return User(cpf=row[0], email=row[1], name=row[2])
-        row = self.db.query_one("INSERT INTO users(cpf, email, name) VALUES (%s, %s, %s) RETURNING cpf", (cpf, email, name))
-        return User(cpf=cpf, email=email, name=name)
+            user = User(cpf=row[0], email=row[1], name=row[2])
+            self.users.put(cpf, user)
+            return user
+        row = self.db.query_one(
+            "INSERT INTO users(cpf, email, name) VALUES (%s, %s, %s) ON CONFLICT (cpf) DO NOTHING RETURNING cpf",
+            (cpf, email, name),
+            primary=True,
+        )
+        user = User(cpf=cpf, email=email, name=name)
+        if row:
+            self.users.put(cpf, user)
+        else:
+            # lost the insert race: the stored row may differ from this request's data
+            self.users.invalidate(cpf)
+        return user
 
-    def create_payment(self, txid: str, user_cpf: CPF, amount: int, pixCopiaECola: str) -> Payment:
-        status = PaymentStatus.ACTIVE.value
-        self.db.execute(
-            "INSERT INTO payments(txid, user_cpf, amount, status, pixCopiaECola) VALUES (%s, %s, %s, %s, %s)",
-            (txid, user_cpf, amount, status, pixCopiaECola),
+    def warm_user_cache(self, limit: int) -> int:
+        """
+        Load the users with the most recent payments into the user cache
+
+        Parameters:
+            limit (int): how many users to load
+        Returns:
+            (int): number of users loaded
+        """
+        rows = self.db.query_all(
+            """SELECT u.cpf, u.email, u.name FROM users AS u
+            JOIN (
+                SELECT user_cpf, MAX(created_at) AS last_payment FROM payments
+                WHERE user_cpf IS NOT NULL GROUP BY user_cpf
+                ORDER BY last_payment DESC LIMIT %s
+            ) AS recent ON recent.user_cpf = u.cpf
+            ORDER BY recent.last_payment""",
+            (min(limit, self.users.maxsize),),
         )
-        return Payment(txid=txid, user_cpf=user_cpf, amount=amount, status=PaymentStatus.ACTIVE, pixCopiaECola=pixCopiaECola)
+        for row in rows:
+            self.users.put(row[0], User(cpf=row[0], email=row[1], name=row[2]))
+        return len(rows)
 
-    def get_payment(self, txid: str) -> Optional[Payment]:
-        row = self.db.query_one("SELECT txid, user_cpf, amount, status, pixCopiaECola FROM payments WHERE txid=%s", (txid,))
+    def create_payment(self,
+                       txid: str,
+                       user_cpf: CPF,
+                       amount: int,
+                       pixCopiaECola: str,
+                       receiver: Optional[str] = None,
+                       expires_in: Optional[int] = None) -> Payment:
+        status = PaymentStatus.ACTIVE.value
+        with self.db.transaction():
+            row = self.db.query_one(
+                "INSERT INTO payments(txid, user_cpf, amount, status, pixCopiaECola, receiver, expires_at) "
+                f"VALUES (%s, %s, %s, %s, %s, %s, {self.sql['seconds_from_now']}) "
+                "RETURNING created_at",
+                (txid, user_cpf, amount, status, pixCopiaECola, receiver, expires_in),
+            )
+            self._record_transitions([_Transition(txid, user_cpf, amount, row[0], None, status)])
+        return Payment(txid=txid, user_cpf=user_cpf, amount=amount, status=PaymentStatus.ACTIVE, pixCopiaECola=pixCopiaECola, receiver=receiver)
+
+    def get_payment(self, txid: str, primary: bool = False) -> Optional[Payment]:
+        row = self.db.query_one(f"SELECT {PAYMENT_COLUMNS} FROM payments WHERE txid=%s", (txid,), primary=primary)
+        if not row:
+            row = self.db.query_one(f"SELECT {PAYMENT_COLUMNS} FROM payments_archive WHERE txid=%s", (txid,), primary=primary)
         if not row:
             return None
-        return Payment(txid=row[0], user_cpf=row[1], amount=row[2], status=PaymentStatus(row[3]), pixCopiaECola=row[4])
+        return self._payment_from_row(row)
+
+    def _payment_from_row(self, row: Tuple) -> Payment:
+        return Payment(txid=row[0], user_cpf=row[1], amount=row[2], status=PaymentStatus(row[3]), pixCopiaECola=row[4], receiver=row[5])
 
     def set_status(self, txid: str, status: PaymentStatus) -> Optional[Payment]:
-        self.db.execute("UPDATE payments SET status=%s, updated_at=CURRENT_TIMESTAMP WHERE txid=%s", (status.value, txid))
-        return self.get_payment(txid)
+        payment, _ = self.transition(txid, status)
+        return payment
+
+    def transition(self, txid: str, status: PaymentStatus) -> Tuple[Optional[Payment], bool]:
+        """
+        Move a payment to 'status' if its current status is one of the allowed
+        predecessors, in a single conditional UPDATE
+
+        Returns:
+            (tuple): the payment (None if it does not exist) and whether it changed
+        """
+        predecessors = [predecessor.value for predecessor in status.predecessors()]
+        if predecessors:
+            placeholders = ", ".join(["%s"] * len(predecessors))
+            with self.db.transaction():
+                row = self.db.query_one(
+                    "UPDATE payments SET previous_status=status, status=%s, updated_at=CURRENT_TIMESTAMP "
+                    f"WHERE txid=%s AND status IN ({placeholders}) "
+                    f"RETURNING {PAYMENT_COLUMNS}, previous_status, created_at",
+                    (status.value, txid, *predecessors),
+                )
+                if row:
+                    self._record_transitions([_Transition(txid, row[1], row[2], row[7], row[6], status.value)])
+            if row:
+                return self._payment_from_row(row), True
+        return self.get_payment(txid, primary=True), False
+
+    def active_expirations(self) -> List[Tuple[str, Optional[str], float]]:
+        """
+        (txid, receiver, seconds until expiry) of every ATIVA payment with an expiry,
+        read through the 'payments_active_expires_at' partial index
+        """
+        rows = self.db.query_all(
+            f"SELECT txid, receiver, {self.sql['seconds_left']} FROM payments "
+            "WHERE status = 'ATIVA' AND expires_at IS NOT NULL ORDER BY expires_at",
+            primary=True,
+        )
+        return [(row[0], row[1], float(row[2])) for row in rows]
+
+    def active_txids(self, txids: List[str]) -> Set[str]:
+        """
+        The subset of 'txids' whose payment is still ATIVA
+        """
+        if not txids:
+            return set()
+        rows = self.db.query_all(
+            f"SELECT txid FROM payments WHERE status = 'ATIVA' AND txid IN ({', '.join(['%s'] * len(txids))})",
+            tuple(txids),
+            primary=True,
+        )
+        return {row[0] for row in rows}
+
+    def expire_payments(self, txids: List[str]) -> List[Payment]:
+        """
+        Mark the given payments as EXPIRADA in a single UPDATE, skipping the ones that
+        are no longer ATIVA
+
+        Returns:
+            (list): the payments that were expired
+        """
+        return self.transition_many(txids, PaymentStatus.EXPIRED)
+
+    def transition_many(self, txids: List[str], status: PaymentStatus) -> List[Payment]:
+        """
+        Move the given payments to 'status' in a single conditional UPDATE, skipping the
+        ones whose current status is not an allowed predecessor
+
+        Returns:
+            (list): the payments that changed
+        """
+        predecessors = [predecessor.value for predecessor in status.predecessors()]
+        if not txids or not predecessors:
+            return []
+        with self.db.transaction():
+            rows = self.db.query_all(
+                "UPDATE payments SET previous_status=status, status=%s, updated_at=CURRENT_TIMESTAMP "
+                f"WHERE txid IN ({', '.join(['%s'] * len(txids))}) AND status IN ({', '.join(['%s'] * len(predecessors))}) "
+                f"RETURNING {PAYMENT_COLUMNS}, previous_status, created_at",
+                (status.value, *txids, *predecessors),
+            )
+            if rows:
+                self._record_transitions([
+                    _Transition(row[0], row[1], row[2], row[7], row[6], status.value) for row in rows
+                ])
+        return [self._payment_from_row(row) for row in rows]
+
+    def iter_payments(self,
+                      inicio: datetime,
+                      fim: datetime,
+                      receiver: Optional[str] = None,
+                      include_unassigned: bool = False,
+                      batch_size: int = 1000) -> Iterator[Payment]:
+        """
+        Stream the payments (archived ones included) created between 'inicio' and 'fim'
+        in txid order (byte-wise, like Python's str ordering) through a server-side cursor
+
+        Parameters:
+            inicio (datetime): range start, naive values are taken as UTC (like the PSP dates)
+            fim (datetime): range end, naive values are taken as UTC
+            receiver (str, optional): only the payments of this receiver
+            include_unassigned (bool, optional): also the payments created before receivers were stored
+        """
+        inicio, fim = (bound if bound.tzinfo else bound.replace(tzinfo=timezone.utc) for bound in (inicio, fim))
+        created = f"created_at >= {self.sql['utc_bound']} AND created_at <= {self.sql['utc_bound']}"
+        receiver_filter, params = "", ()
+        if receiver and include_unassigned:
+            receiver_filter, params = "AND (receiver = %s OR receiver IS NULL)", (receiver,)
+        elif receiver:
+            receiver_filter, params = "AND receiver = %s", (receiver,)
+        rows = self.db.stream(
+            # NOTE: a UNION only accepts plain output columns in ORDER BY, hence the subquery for the COLLATE
+            f"""SELECT * FROM (
+                SELECT {PAYMENT_COLUMNS} FROM payments WHERE {created} {receiver_filter}
+                UNION ALL
+                SELECT {PAYMENT_COLUMNS} FROM payments_archive WHERE {created} {receiver_filter}
+            ) AS p
+            ORDER BY {self.sql['txid_order']}
+            """,
+            (inicio, fim, *params, inicio, fim, *params),
+            batch_size=batch_size,
+        )
+        for row in rows:
+            yield self._payment_from_row(row)
+
+    def get_history(self, txid: str) -> List[PaymentEvent]:
+        rows = self.db.query_all(
+            "SELECT txid, old_status, new_status, created_at FROM payment_events WHERE txid=%s ORDER BY created_at",
+            (txid,),
+        )
+        return [
+            PaymentEvent(
+                txid=row[0],
+                old_status=PaymentStatus(row[1]) if row[1] else None,
+                new_status=PaymentStatus(row[2]),
+                created_at=row[3],
+            )
+            for row in rows
+        ]
+
+    def archive_settled(self, retention_days: int, batch_size: int = 1000) -> int:
+        """
+        Move settled payments (CONCLUIDA / REMOVIDA_* / EXPIRADA) last updated more than
+        'retention_days' ago from 'payments' to 'payments_archive' (its monthly partitions
+        on PostgreSQL), 'batch_size' rows per transaction
+
+        Returns:
+            (int): number of archived payments
+        """
+        statuses = ", ".join(["%s"] * len(SETTLED_STATUSES))
+        settled = f"status IN ({statuses}) AND updated_at < {self.sql['days_ago']}"
+
+        if self.db.dialect == "postgresql":
+            bounds = self.db.query_one(
+                f"SELECT MIN(updated_at), MAX(updated_at) FROM payments WHERE {settled}",
+                (*SETTLED_STATUSES, retention_days),
+                primary=True,
+            )
+            if not bounds or bounds[0] is None:
+                return 0
+
+            month, last = _month_start(bounds[0].date()), bounds[1].date()
+            while month <= last:
+                self._ensure_month_partition("payments_archive", month)
+                month = _next_month(month)
+
+        archived = 0
+        while True:
+            with self.db.transaction():
+                if self.db.dialect == "postgresql":
+                    moved = self.db.execute(
+                        f"""WITH moved AS (
+                            DELETE FROM payments WHERE txid IN (
+                                SELECT txid FROM payments WHERE {settled}
+                                ORDER BY updated_at LIMIT %s
+                                FOR UPDATE SKIP LOCKED
+                            )
+                            RETURNING {PAYMENT_COLUMNS}, created_at, updated_at
+                        )
+                        INSERT INTO payments_archive({PAYMENT_COLUMNS}, created_at, updated_at)
+                        SELECT {PAYMENT_COLUMNS}, created_at, updated_at FROM moved""",
+                        (*SETTLED_STATUSES, retention_days, batch_size),
+                    )
+                else:
+                    txids = [row[0] for row in self.db.query_all(
+                        f"SELECT txid FROM payments WHERE {settled} ORDER BY updated_at LIMIT %s",
+                        (*SETTLED_STATUSES, retention_days, batch_size),
+                    )]
+                    moved = len(txids)
+                    if txids:
+                        placeholders = ", ".join(["%s"] * len(txids))
+                        self.db.execute(
+                            f"INSERT INTO payments_archive({PAYMENT_COLUMNS}, created_at, updated_at) "
+                            f"SELECT {PAYMENT_COLUMNS}, created_at, updated_at FROM payments WHERE txid IN ({placeholders})",
+                            tuple(txids),
+                        )
+                        self.db.execute(f"DELETE FROM payments WHERE txid IN ({placeholders})", tuple(txids))
+            archived += moved
+            if moved < batch_size:
+                return archived
+
+    def rebuild_rollups(self) -> None:
+        """
+        Recompute 'payment_rollups' from 'payments' and 'payments_archive' (backfill)
+        """
+        with self.db.transaction():
+            self.db.execute("DELETE FROM payment_rollups")
+            for granularity in ROLLUP_GRANULARITIES:
+                for user_column, user_filter in (("''", ""), ("user_cpf", "WHERE user_cpf IS NOT NULL")):
+                    self.db.execute(
+                        f"""INSERT INTO payment_rollups(granularity, bucket, status, user_cpf, count, amount)
+                        SELECT %s, {self.sql['bucket_' + granularity]}, status, {user_column}, COUNT(*), SUM(amount)
+                        FROM (
+                            SELECT created_at, status, user_cpf, amount FROM payments
+                            UNION ALL
+                            SELECT created_at, status, user_cpf, amount FROM payments_archive
+                        ) AS p
+                        {user_filter}
+                        GROUP BY 2, 3, 4""",
+                        (granularity,),
+                    )
+
+    def rollup_summary(self,
+                       inicio: datetime,
+                       fim: datetime,
+                       granularity: str = "day",
+                       user_cpf: Optional[str] = None,
+                       by_user: bool = False) -> List[RollupBucket]:
+        """
+        Totals per bucket and status for payments created between 'inicio' and 'fim'
+
+        Parameters:
+            granularity (str): 'hour' or 'day'
+            user_cpf (str, optional): only this user's payments
+            by_user (bool, optional): one row per user instead of the totals for all users
+        Returns:
+            (list): RollupBucket rows ordered by bucket
+        """
+        if granularity not in ROLLUP_GRANULARITIES:
+            raise ValueError(f"Unknown granularity: {granularity}")
+
+        if user_cpf:
+            user_filter, params = "user_cpf = %s", (user_cpf,)
+        elif by_user:
+            user_filter, params = "user_cpf <> ''", ()
+        else:
+            user_filter, params = "user_cpf = ''", ()
+
+        rows = self.db.query_all(
+            f"""SELECT bucket, status, user_cpf, count, amount FROM payment_rollups
+            WHERE granularity = %s AND bucket >= %s AND bucket <= %s AND {user_filter} AND count <> 0
+            ORDER BY bucket, user_cpf, status""",
+            (granularity, _truncate(inicio, granularity), fim, *params),
+        )
+        return [
+            RollupBucket(bucket=row[0], status=PaymentStatus(row[1]), count=row[3], amount=row[4], user_cpf=row[2] or None)
+            for row in rows
+        ]
@@ -0,0 +1,222 @@
+# app/store/sqlite.py
+from __future__ import annotations
+import os
+import queue
+import shutil
+import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+# TIMESTAMP columns go in and out as datetime, like with psycopg; they hold UTC
+# (CURRENT_TIMESTAMP), so timezone-aware values are stored converted to naive UTC
+sqlite3.register_adapter(
+    datetime,
+    lambda value: (value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value).isoformat(" "),
+)
+sqlite3.register_converter("TIMESTAMP", lambda value: datetime.fromisoformat(value.decode()))
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA foreign_keys=ON",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA mmap_size=268435456",
+)
+
+
+@lru_cache(maxsize=512)
+def _to_qmark(query: str) -> str:
+    """
+    The Repository SQL uses the psycopg '%s' placeholders; sqlite3 wants '?'
+    """
+    return query.replace("%s", "?")
+
+
+class SqliteDatabase:
+    """
+    Embedded storage for single-node deployments (DATABASE_URL=sqlite:///path/to.db),
+    with the same interface as the PostgreSQL Database.
+
+    Each thread gets its own connection (WAL lets readers run while one writer
+    commits), and sqlite3 keeps a per-connection cache of prepared statements, so
+    repeated queries skip parsing. Transactions start with BEGIN IMMEDIATE to take
+    the write lock up front instead of failing on a lock upgrade. There are no
+    replicas: 'primary' and 'read_your_writes()' are accepted and ignored.
+    NOTIFY/LISTEN are replaced by an in-process pub/sub.
+    """
+    dialect = "sqlite"
+
+    def __init__(self, database_url: str, cached_statements: int = 256, **_):
+        self.database_url = database_url
+        self.path = database_url.split("sqlite:///", 1)[-1]
+        self._tempdir: Optional[str] = None
+        if self.path in ("", ":memory:"):
+            # NOTE: a shared-cache memory database uses table locks that fail right away
+            # (SQLITE_LOCKED, no busy_timeout) under concurrent threads, so ':memory:' is a
+            # temporary WAL file instead, removed on close
+            self._tempdir = tempfile.mkdtemp(prefix="pixmodule_")
+            self.path = os.path.join(self._tempdir, "pix.db")
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._listeners: Dict[str, Set[queue.Queue]] = {}
+        self._keeper: Optional[sqlite3.Connection] = None
+
+    def _open(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(
+            self.path,
+            isolation_level=None,
+            check_same_thread=False,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            cached_statements=self.cached_statements,
+        )
+        for pragma in PRAGMAS:
+            connection.execute(pragma)
+        with self._lock:
+            self._connections.append(connection)
+        return connection
+
+    @property
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            if self._keeper is None:
+                raise RuntimeError("Database not connected")
+            connection = self._local.connection = self._open()
+        return connection
+
+    def connect(self) -> None:
+        if self._keeper is None:
+            if self._tempdir:
+                os.makedirs(self._tempdir, exist_ok=True)
+            self._keeper = self._open()
+
+    def is_connected(self) -> bool:
+        return self._keeper is not None
+
+    @contextmanager
+    def read_your_writes(self) -> Iterator[None]:
+        yield
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """
+        Run the block in a single transaction (nested blocks become savepoints);
+        notifications issued inside it are delivered on commit
+        """
+        connection = self._connection
+        depth = getattr(self._local, "depth", 0)
+        if depth:
+            savepoint = f"sp_{depth}"
+            connection.execute(f"SAVEPOINT {savepoint}")
+            self._local.depth = depth + 1
+            try:
+                yield
+            except BaseException:
+                connection.execute(f"ROLLBACK TO {savepoint}")
+                raise
+            finally:
+                self._local.depth = depth
+            connection.execute(f"RELEASE {savepoint}")
+            return
+
+        self._local.depth = 1
+        self._local.pending = []
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            connection.execute("ROLLBACK")
+            self._local.pending = []
+            raise
+        else:
+            connection.execute("COMMIT")
+            pending, self._local.pending = self._local.pending, []
+            for channel, payloads in pending:
+                self._publish(channel, payloads)
+        finally:
+            self._local.depth = 0
+
+    def execute(self, query: str, params: Optional[Tuple] = None) -> int:
+        return self._connection.execute(_to_qmark(query), params or ()).rowcount
+
+    def query_one(self, query: str, params: Optional[Tuple] = None, primary: bool = False) -> Optional[Tuple[Any, ...]]:
+        cursor = self._connection.execute(_to_qmark(query), params or ())
+        row = cursor.fetchone()
+        cursor.close()
+        return row
+
+    def query_all(self, query: str, params: Optional[Tuple] = None, primary: bool = False) -> List[Tuple[Any, ...]]:
+        return self._connection.execute(_to_qmark(query), params or ()).fetchall()
+
+    def stream(self, query: str, params: Optional[Tuple] = None, batch_size: int = 1000, primary: bool = False) -> Iterator[Tuple[Any, ...]]:
+        """
+        Iterate over the rows of 'query' on a dedicated connection, 'batch_size' rows at a time
+        """
+        connection = self._open()
+        try:
+            cursor = connection.execute(_to_qmark(query), params or ())
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                yield from rows
+        finally:
+            self._discard(connection)
+
+    def notify(self, channel: str, payloads: List[str]) -> None:
+        if not payloads:
+            return
+        if getattr(self._local, "depth", 0):
+            self._local.pending.append((channel, payloads))
+        else:
+            self._publish(channel, payloads)
+
+    def _publish(self, channel: str, payloads: List[str]) -> None:
+        with self._lock:
+            listeners = list(self._listeners.get(channel, ()))
+        for listener in listeners:
+            for payload in payloads:
+                listener.put(payload)
+
+    def listen(self, channel: str, stop: threading.Event) -> Iterator[Optional[str]]:
+        """
+        Yield the payloads notified on 'channel' by this process until 'stop' is set
+        (None first, like the PostgreSQL Database)
+        """
+        listener: queue.Queue = queue.Queue()
+        with self._lock:
+            self._listeners.setdefault(channel, set()).add(listener)
+        try:
+            yield None
+            while not stop.is_set():
+                try:
+                    yield listener.get(timeout=1.0)
+                except queue.Empty:
+                    continue
+        finally:
+            with self._lock:
+                self._listeners[channel].discard(listener)
+
+    def _discard(self, connection: sqlite3.Connection) -> None:
+        with self._lock:
+            if connection in self._connections:
+                self._connections.remove(connection)
+        connection.close()
+
+    def close(self) -> None:
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
+        self._keeper = None
+        self._local = threading.local()
+        if self._tempdir:
+            shutil.rmtree(self._tempdir, ignore_errors=True)
@@ -0,0 +1,94 @@
+# benchmarks/hot_paths.py
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Callable, List
+from pydantic import ValidationError
+from app.config import Settings
+from app.models.schemas import CreatePaymentRequest, PaymentResponse, PaymentStatus
+from app.services.pix import Pix
+from app.api.v1.router import _sign_payload
+
+VALID_CPF = "52998224725"
+VALID_TXID = "7978c0c97ea847e78e8849634473c1f1"
+
+
+@dataclass
+class Case:
+    name: str
+    func: Callable[[], object]
+
+
+def _rejects(validate: Callable[[], object]) -> Callable[[], object]:
+    def run() -> None:
+        try:
+            validate()
+        except ValidationError:
+            pass
+    return run
+
+
+def _pix() -> Pix:
+    # offline instance: no certificate, the session is never used
+    return Pix(Settings(
+        debug=True,
+        database_url="sqlite:///:memory:",
+        psp_client_id="bench",
+        psp_client_secret="bench",
+        psp_pix_key="bench",
+        psp_crt_path=None,
+        psp_key_path=None,
+        psp_pfx_path=None,
+        receiver_names="",
+    ))
+
+
+def build_cases() -> List[Case]:
+    """
+    The CPU-bound code run on every charge/webhook, each with representative and
+    adversarial (malformed, oversized) inputs
+    """
+    pix = _pix()
+    payment = {
+        "amount": 150.75,
+        "cpf": VALID_CPF,
+        "name": "Maria da Silva",
+        "email": "maria@example.com",
+    }
+    response = {
+        "txid": VALID_TXID,
+        "status": "ATIVA",
+        "user_cpf": VALID_CPF,
+        "amount": 150.75,
+        "pixCopiaECola": "00020101021226880014br.gov.bcb.pix" + "0" * 180,
+        "receiver": "default",
+    }
+    small_body = b'{"txid": "' + VALID_TXID.encode() + b'", "new_status": "CONCLUIDA"}'
+    large_body = b'{"pad": "' + b"x" * 65536 + b'"}'
+
+    return [
+        Case("amount_valid", lambda: pix._amount_format_is_valid("1234.56")),
+        Case("amount_invalid", lambda: pix._amount_format_is_valid("12.345")),
+        Case("amount_oversized", lambda: pix._amount_format_is_valid("9" * 4096 + ".00")),
+        Case("txid_valid", lambda: pix._txid_format_is_valid(VALID_TXID)),
+        Case("txid_invalid", lambda: pix._txid_format_is_valid("short-txid")),
+        Case("txid_oversized", lambda: pix._txid_format_is_valid("a" * 4096)),
+        Case("date_valid", lambda: pix._date_format_is_valid("2024-01-31-23-59-59")),
+        Case("date_out_of_range", lambda: pix._date_format_is_valid("2024-13-32-25-61-61")),
+        Case("date_garbage", lambda: pix._date_format_is_valid("x" * 1024)),
+        Case("to_rfc3339", lambda: pix._to_rfc3339("2024-01-31-23-59-59")),
+        Case("sign_payload_small", lambda: _sign_payload("secret", "1700000000", small_body)),
+        Case("sign_payload_64k", lambda: _sign_payload("secret", "1700000000", large_body)),
+        Case("create_payment_request", lambda: CreatePaymentRequest.model_validate(payment)),
+        Case("create_payment_request_formatted_cpf",
+             lambda: CreatePaymentRequest.model_validate({**payment, "cpf": "529.982.247-25"})),
+        Case("create_payment_request_invalid_cpf",
+             _rejects(lambda: CreatePaymentRequest.model_validate({**payment, "cpf": "11111111111"}))),
+        Case("create_payment_request_oversized_cpf",
+             _rejects(lambda: CreatePaymentRequest.model_validate({**payment, "cpf": "1" * 4096}))),
+        Case("payment_response", lambda: PaymentResponse.model_validate(response)),
+        Case("payment_response_dump", lambda: PaymentResponse.model_validate(response).model_dump_json()),
+        Case("status_from_psp_concluded", lambda: PaymentStatus.from_psp("CONCLUIDA")),
+        Case("status_from_psp_removed", lambda: PaymentStatus.from_psp("REMOVIDA_PELO_PSP")),
+        Case("status_from_psp_lowercase", lambda: PaymentStatus.from_psp("removida_pelo_usuario_recebedor")),
+        Case("status_from_psp_unknown", lambda: PaymentStatus.from_psp("?" * 1024)),
+    ]
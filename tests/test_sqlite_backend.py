@@ -0,0 +1,231 @@
+# tests/test_sqlite_backend.py
+from __future__ import annotations
+import time
+from datetime import datetime
+import pytest
+from app.models.schemas import ALLOWED_TRANSITIONS, FINAL_STATUSES, PaymentStatus
+from app.services.dedup import RecentEvents
+from app.services.receivers import Receiver, ReceiverError, ReceiverPool
+from app.services.reconcile import AMOUNT_MISMATCH, MISSING_LOCAL, MISSING_PSP, STATUS_MISMATCH, merge_join, sorted_by_txid
+from app.store.backend import open_database
+from app.store.cache import TTLCache
+from app.store.repository import Payment, Repository
+
+CPF = "52998224725"
+OTHER_CPF = "11144477735"
+
+
+def _txid(n: int) -> str:
+    return f"{n:032d}"
+
+
+@pytest.fixture
+def repo():
+    db = open_database("sqlite:///:memory:")
+    repo = Repository(db)
+    repo.get_or_create_user(CPF, "maria@example.com", "Maria")
+    repo.get_or_create_user(OTHER_CPF, "joao@example.com", "Joao")
+    yield repo
+    db.close()
+
+
+def _rollups(repo: Repository):
+    return repo.db.query_all(
+        "SELECT granularity, bucket, status, user_cpf, count, amount FROM payment_rollups "
+        "WHERE count <> 0 ORDER BY granularity, bucket, status, user_cpf"
+    )
+
+
+# ALLOWED_TRANSITIONS / Repository.transition
+
+def test_final_statuses():
+    assert FINAL_STATUSES == {PaymentStatus.CONCLUDED, PaymentStatus.REMOVED_BY_USER, PaymentStatus.REMOVED_BY_PSP}
+    assert ALLOWED_TRANSITIONS[PaymentStatus.ACTIVE] == ()
+
+
+@pytest.mark.parametrize("status", [s for s in PaymentStatus if s != PaymentStatus.ACTIVE])
+def test_transition_from_active(repo, status):
+    repo.create_payment(_txid(1), CPF, 100, "pix")
+    payment, changed = repo.transition(_txid(1), status)
+    assert changed and payment.status == status
+
+
+def test_transition_expired_can_still_settle(repo):
+    repo.create_payment(_txid(1), CPF, 100, "pix")
+    repo.expire_payments([_txid(1)])
+    payment, changed = repo.transition(_txid(1), PaymentStatus.CONCLUDED)
+    assert changed and payment.status == PaymentStatus.CONCLUDED
+
+
+@pytest.mark.parametrize("final", sorted(FINAL_STATUSES))
+@pytest.mark.parametrize("status", list(PaymentStatus))
+def test_transition_out_of_final_is_refused(repo, final, status):
+    repo.create_payment(_txid(1), CPF, 100, "pix")
+    repo.transition(_txid(1), final)
+    payment, changed = repo.transition(_txid(1), status)
+    assert not changed and payment.status == final
+
+
+def test_transition_unknown_payment(repo):
+    assert repo.transition(_txid(9), PaymentStatus.CONCLUDED) == (None, False)
+
+
+def test_transition_many_skips_disallowed(repo):
+    for n in range(3):
+        repo.create_payment(_txid(n), CPF, 100, "pix")
+    repo.transition(_txid(0), PaymentStatus.CONCLUDED)
+    expired = repo.expire_payments([_txid(0), _txid(1), _txid(2)])
+    assert sorted(p.txid for p in expired) == [_txid(1), _txid(2)]
+    assert repo.get_payment(_txid(0)).status == PaymentStatus.CONCLUDED
+
+
+# payment_rollups deltas vs rebuild_rollups
+
+def test_rollup_deltas_match_rebuild(repo):
+    for n in range(6):
+        repo.create_payment(_txid(n), CPF if n % 2 else OTHER_CPF, 100 * (n + 1), "pix")
+    repo.transition(_txid(0), PaymentStatus.CONCLUDED)
+    repo.transition(_txid(1), PaymentStatus.REMOVED_BY_USER)
+    repo.expire_payments([_txid(2), _txid(3)])
+    repo.transition(_txid(2), PaymentStatus.CONCLUDED)
+    # refused transitions must not touch the rollups
+    repo.transition(_txid(0), PaymentStatus.REMOVED_BY_PSP)
+
+    incremental = _rollups(repo)
+    assert incremental
+    repo.rebuild_rollups()
+    assert _rollups(repo) == incremental
+
+
+def test_rollup_summary_totals(repo):
+    repo.create_payment(_txid(1), CPF, 100, "pix")
+    repo.create_payment(_txid(2), CPF, 250, "pix")
+    repo.transition(_txid(2), PaymentStatus.CONCLUDED)
+    inicio, fim = repo.db.query_one("SELECT MIN(created_at), MAX(created_at) FROM payments")
+    buckets = repo.rollup_summary(datetime.fromisoformat(inicio), datetime.fromisoformat(fim))
+    totals = {b.status: (b.count, b.amount) for b in buckets}
+    assert totals == {PaymentStatus.ACTIVE: (1, 100), PaymentStatus.CONCLUDED: (1, 250)}
+
+
+# merge_join / sorted_by_txid
+
+def _charge(txid: str, status: str = "ATIVA", amount: str = "1.00") -> dict:
+    return {"txid": txid, "status": status, "valor": {"original": amount}}
+
+
+def _payment(txid: str, status: PaymentStatus = PaymentStatus.ACTIVE, amount: int = 100) -> Payment:
+    return Payment(txid=txid, user_cpf=CPF, amount=amount, status=status, pixCopiaECola="pix", receiver=None)
+
+
+@pytest.mark.parametrize("run_size", [3, 100_000])
+def test_sorted_by_txid(run_size):
+    txids = [_txid(n) for n in (7, 3, 9, 1, 5, 2, 8, 4, 6, 0)]
+    charges = list(sorted_by_txid((_charge(txid) for txid in txids), run_size=run_size))
+    assert [c["txid"] for c in charges] == sorted(txids)
+    assert charges[0] == _charge(_txid(0))
+
+
+def test_merge_join():
+    charges = [
+        _charge(_txid(1)),
+        _charge(_txid(2), "CONCLUIDA"),
+        _charge(_txid(3), "ATIVA", "2.50"),
+        _charge(_txid(4)),
+        _charge(_txid(6)),
+    ]
+    payments = [
+        _payment(_txid(1)),
+        _payment(_txid(2)),
+        _payment(_txid(3)),
+        _payment(_txid(5)),
+        _payment(_txid(6), PaymentStatus.EXPIRED),
+    ]
+    diffs = [(d.txid, d.kind) for d in merge_join(sorted_by_txid(charges, run_size=2), iter(payments))]
+    assert diffs == [
+        (_txid(2), STATUS_MISMATCH),
+        (_txid(3), AMOUNT_MISMATCH),
+        (_txid(4), MISSING_LOCAL),
+        (_txid(5), MISSING_PSP),
+    ]
+
+
+def test_merge_join_empty_sides():
+    assert [d.kind for d in merge_join(iter([_charge(_txid(1))]), iter([]))] == [MISSING_LOCAL]
+    assert [d.kind for d in merge_join(iter([]), iter([_payment(_txid(1))]))] == [MISSING_PSP]
+
+
+# ReceiverPool routing
+
+def _pool(policy: str, **weights: int) -> ReceiverPool:
+    return ReceiverPool([Receiver(name, psp=None, weight=weight) for name, weight in weights.items()], policy=policy)
+
+
+def test_round_robin_follows_weights():
+    pool = _pool("round_robin", a=5, b=1, c=1)
+    picks = [pool.select().name for _ in range(7)]
+    assert {name: picks.count(name) for name in "abc"} == {"a": 5, "b": 1, "c": 1}
+    # smooth: the heavy receiver is not picked 5 times in a row
+    assert picks != ["a"] * 5 + ["b", "c"]
+
+
+def test_least_loaded_divides_by_weight():
+    pool = _pool("least_loaded", a=2, b=1)
+    with pool.acquire() as first, pool.acquire() as second:
+        assert first.name == "a" and second.name == "b"
+        assert pool.select().name == "a"
+    assert all(receiver.in_flight == 0 for receiver in pool.receivers.values())
+
+
+def test_tenant_policy_and_explicit_receiver():
+    pool = _pool("tenant", a=1, b=1)
+    assert [pool.select().name for _ in range(3)] == ["a", "a", "a"]
+    assert pool.select("b").name == "b"
+    with pytest.raises(ReceiverError):
+        pool.select("missing")
+
+
+def test_receiver_weight_must_be_positive():
+    with pytest.raises(ValueError):
+        _pool("round_robin", a=1, b=0)
+
+
+# TTLCache / RecentEvents
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats() == {"size": 2, "maxsize": 2, "hits": 3, "misses": 1, "hit_ratio": 0.75}
+
+
+def test_ttl_cache_expires_entries():
+    cache = TTLCache(maxsize=2, ttl=0.01)
+    cache.put("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a") is None and len(cache) == 0
+
+
+def test_ttl_cache_disabled():
+    cache = TTLCache(maxsize=0)
+    cache.put("a", 1)
+    assert not cache.enabled and cache.get("a") is None
+
+
+def test_user_cache_is_filled_on_lookup(repo):
+    repo.users.clear()
+    repo.get_or_create_user(CPF, "outro@example.com", "Outro")
+    assert repo.users.get(CPF).email == "maria@example.com"
+
+
+def test_recent_events_is_a_bounded_lru():
+    events = RecentEvents(maxsize=2)
+    events.add("a")
+    events.add("b")
+    assert "a" in events
+    events.add("c")
+    assert "b" not in events
+    assert "a" in events and "c" in events and len(events) == 2